@@ -0,0 +1,120 @@
+import asyncio
+import socket
+import threading
+import time
+
+import metrics
+from control import _ENVELOPE, CONTROL_PORT, MAX_FRAME, _header, encode_frame, encode_frames, wire_reply
+from wire import decode
+
+WRITE_BUFFER_HIGH = 64 * 1024  # Stop reading a client whose acks pile up past this
+
+
+class AsyncControlServer:
+    """Control-channel server on a single asyncio event loop.
+
+    Speaks the framing of control.Connection, but without a thread per
+    connection. Commands are applied inline on the loop, since the
+    handler only pokes the player, and each ack is written before the
+    next frame is read. A client that stops reading its acks therefore
+    fills the write buffer, `drain()` blocks, and its reads stop too.
+    That gives per-connection backpressure for free. The acks for a
+    frame of several commands go out together in one frame, in the wire
+    format agreed with that client. The time spent on every message, from
+    decode to queued ack, goes into the streamer_control_message_seconds
+    histogram.
+
+    With `path` it listens on a Unix socket instead, as the engine does
+    for its frontends. `listening` is set once clients can connect.
+    """
+
+    def __init__(self, handler, host="0.0.0.0", port=CONTROL_PORT, on_state=None, path=None):
+        self.handler = handler
+        self.on_state = on_state
+        self.address = (host, port)
+        self.path = path
+        self.loop = None
+        self.writers = {}  # writer -> wire version its frames are encoded in
+        self.listening = threading.Event()
+        self._stopping = None
+        self._cost = metrics.histogram("streamer_control_message_seconds", "Server-side cost per control message")
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if self.path:
+            server = await asyncio.start_unix_server(self._serve_connection, path=self.path)
+        else:
+            server = await asyncio.start_server(self._serve_connection, *self.address)
+        self.listening.set()
+        async with server:
+            await self._stopping.wait()
+        for writer in list(self.writers):
+            writer.close()  # Connection tasks see EOF and finish on their own
+        while self.writers:
+            await asyncio.sleep(0.01)
+
+    async def _serve_connection(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        self.writers[writer] = 0
+        try:
+            while True:
+                (size,) = _header.unpack(await reader.readexactly(_header.size))
+                if size > MAX_FRAME:
+                    break
+                payload = await reader.readexactly(size)
+                start = time.perf_counter()
+                messages = decode(payload)
+                replies = [self._dispatch(writer, message) for message in messages]
+                replies = [reply for reply in replies if reply is not None]
+                if replies:
+                    writer.write(encode_frames(replies, self.writers[writer]))
+                cost = (time.perf_counter() - start) / len(messages)
+                for _ in messages:
+                    self._cost.observe(cost)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.writers.pop(writer, None)
+            writer.close()
+
+    def _dispatch(self, writer, message):
+        kind = message.get("type")
+        if kind == "cmd":
+            fields = {k: v for k, v in message.items() if k not in _ENVELOPE}
+            try:
+                reply = self.handler(message["action"], message.get("params"), **fields)
+            except Exception as e:
+                reply = {"status": "error", "message": str(e)}
+            return dict(reply, type="ack", id=message.get("id"))
+        if kind == "state" and self.on_state:
+            self.on_state(message.get("state"))
+        if kind == "wire":
+            self.writers[writer], reply = wire_reply(message)
+            return reply
+        return None  # Acks: this side never issues requests
+
+    def push_state(self, state):
+        """Push a state message to every connected partner; safe from any thread."""
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self._broadcast, {"type": "state", "state": state})
+
+    def _broadcast(self, message):
+        frames = {}  # Encoded once per wire version in use
+        for writer, version in list(self.writers.items()):
+            if not writer.is_closing():
+                if version not in frames:
+                    frames[version] = encode_frame(message, version)
+                writer.write(frames[version])
+
+    def close(self):
+        if self.loop and self._stopping:
+            self.loop.call_soon_threadsafe(self._stopping.set)
@@ -0,0 +1,208 @@
+"""Cold-start benchmark: time from launch to a usable window and a warm engine.
+
+Each run stops any running engine and launches the frontend with
+--startup-report. It records the wall time until the frontend prints its
+startup phases, which happens once the window is mapped and the engine is
+attached. It then records how long the engine the frontend spawned takes to
+warm up, meaning libvlc, the HTTP and control servers, and LAN discovery.
+A second launch, with the engine left running, measures reopening the UI.
+
+Without a display the frontend cannot start. The engine is then launched
+and timed on its own, and reopening is timed as a bare IPC attach. "Cold"
+means no engine process, not an empty OS file cache. Results are written
+as JSON.
+
+    python bench_startup.py --runs 5
+    python bench_startup.py --runs 5 --exe dist/gui/gui.exe
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from ipc import EngineClient, connect_engine, engine_command
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def summary(values):
+    """Median, p95 and mean of a list of ms timings."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    return {
+        "p50_ms": statistics.median(ordered),
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "mean_ms": statistics.fmean(ordered),
+        "n": len(ordered),
+    }
+
+
+def stop_engine(timeout=10.0):
+    """Shut down a running engine and wait until its socket is gone."""
+    try:
+        EngineClient().connect(spawn=False).call("shutdown")
+    except ConnectionError:
+        return
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        sock = connect_engine()
+        if sock is None:
+            return
+        sock.close()
+        time.sleep(0.05)
+    raise RuntimeError("The engine did not shut down")
+
+
+def wait_warm(start, timeout=30.0):
+    """Poll the engine until warm-up is done; (ms since `start`, its state)."""
+    client = EngineClient().connect(spawn=False)
+    try:
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            state = client.call("state")
+            if state["warm"]:
+                return (time.perf_counter() - start) * 1000, state
+            time.sleep(0.005)
+    finally:
+        client.close()
+    raise RuntimeError("The engine did not warm up")
+
+
+def launch_frontend(command, timeout=30.0):
+    """Start the frontend and wait for its startup report; (wall ms, report), or (None, stderr)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        for line in proc.stdout:
+            if line.startswith("{"):
+                wall = (time.perf_counter() - start) * 1000
+                proc.wait(timeout)
+                return wall, json.loads(line)
+        proc.wait(timeout)
+        return None, proc.stderr.read().strip().splitlines()[-1:]
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+
+
+def launch_engine(command, timeout=30.0):
+    """Start the engine by itself; ms until it accepts frontends, ms until warm, its state."""
+    start = time.perf_counter()
+    subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    end = time.monotonic() + timeout
+    sock = connect_engine()
+    while sock is None and time.monotonic() < end:
+        time.sleep(0.002)
+        sock = connect_engine()
+    if sock is None:
+        raise RuntimeError("The engine did not start")
+    ipc = (time.perf_counter() - start) * 1000
+    sock.close()
+    warm, state = wait_warm(start, timeout)
+    return ipc, warm, state
+
+
+def attach_ms():
+    """Reopening without a window: connect to the running engine and fetch its state."""
+    start = time.perf_counter()
+    client = EngineClient().connect(spawn=False)
+    client.call("state")
+    elapsed = (time.perf_counter() - start) * 1000
+    client.close()
+    return elapsed
+
+
+def eager_imports_ms(runs=3):
+    """Launch-to-ready cost of importing VLC and the network stack up front, as the UI used to."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import vlc, flask, waitress, requests"], cwd=HERE, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    bare = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        bare.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings) - statistics.median(bare)
+
+
+def phase_summaries(reports):
+    """Per-phase summaries of a list of startup reports."""
+    phases = {}
+    for report in reports:
+        for phase, ms in (report or {}).items():
+            phases.setdefault(phase, []).append(ms)
+    return {phase: summary(values) for phase, values in phases.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="cold starts to time")
+    parser.add_argument("--exe", help="bundled executable to time instead of the sources")
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    frontend = [args.exe, "--startup-report"] if args.exe else [sys.executable, os.path.join(HERE, "gui.py"), "--startup-report"]
+    engine = [args.exe, "--engine"] if args.exe else engine_command()
+    launch, window, engine_ipc, engine_warm, reopen = [], [], [], [], []
+    frontend_reports, engine_reports = [], []
+    headless_reason, engine_error = None, None
+
+    stop_engine()
+    for run in range(args.runs):
+        if headless_reason is None:
+            wall, report = launch_frontend(frontend)
+            if wall is None:
+                headless_reason = " ".join(report) or "frontend exited without a report"
+                print(f"Frontend unavailable ({headless_reason}); timing the engine alone")
+            else:
+                start = time.perf_counter() - wall / 1000
+                launch.append(wall)
+                window.append(report["frontend"]["window"])
+                frontend_reports.append(report["frontend"])
+                warm, state = wait_warm(start)
+                engine_warm.append(warm)
+                engine_reports.append(state["startup"])
+                engine_error = state["error"]
+                reopen_wall, _ = launch_frontend(frontend)
+                reopen.append(reopen_wall)
+        if headless_reason is not None:
+            ipc, warm, state = launch_engine(engine)
+            engine_ipc.append(ipc)
+            engine_warm.append(warm)
+            engine_reports.append(state["startup"])
+            engine_error = state["error"]
+            reopen.append(attach_ms())
+        stop_engine()
+        print(f"Run {run + 1}/{args.runs} done")
+
+    results = {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "target": args.exe or "sources",
+        "headless": headless_reason,
+        "launch_to_attached": summary(launch),
+        "window_phase": summary(window),
+        "engine_launch_to_ipc": summary(engine_ipc),
+        "engine_launch_to_warm": summary(engine_warm),
+        "reopen": summary(reopen),
+        "frontend_phases": phase_summaries(frontend_reports),
+        "engine_phases": phase_summaries(engine_reports),
+        "engine_error": engine_error,
+    }
+    if not args.exe:
+        results["eager_imports_ms"] = eager_imports_ms()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""Loopback benchmark: command latency, throughput and sync error between peers.
+
+Starts one host and N peer processes on localhost, each with a simulated
+player in place of VLC, and puts an impairment proxy in front of every
+control port to add latency, jitter and loss. Results are written as JSON.
+
+    python bench_sync.py --peers 3 --latency 40 --jitter 10 --loss 0.01
+"""
+import argparse
+import json
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from aioserver import AsyncControlServer
+from clocksync import clock_now
+from control import ControlChannel
+from fakeplayer import SimulatedPlayer
+import metrics
+from playeractor import PlayerActor
+from preroll import Preroller
+from sync import DriftCorrector
+
+BENCH_FINGERPRINT = "bench-media"
+BASE_PORT = 17000
+
+
+class ImpairedLink:
+    """TCP proxy that delays each direction by latency +/- jitter.
+
+    A lost segment is modelled the way TCP experiences it: the data still
+    arrives, but only after a retransmission timeout. Ordering within a
+    direction is preserved.
+    """
+
+    def __init__(self, listen_port, target_port, latency, jitter, loss, rto=0.2):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.latency, self.jitter, self.loss, self.rto = latency, jitter, loss, rto
+
+    def start(self):
+        server = socket.create_server(("127.0.0.1", self.listen_port))
+        threading.Thread(target=self._accept, args=(server,), daemon=True).start()
+        return self
+
+    def _accept(self, server):
+        while True:
+            client, _ = server.accept()
+            upstream = socket.create_connection(("127.0.0.1", self.target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream)
+            self._pipe(upstream, client)
+
+    def _pipe(self, source, dest):
+        pending = []
+        cond = threading.Condition()
+
+        def reader():
+            release = 0.0
+            while True:
+                try:
+                    data = source.recv(65536)
+                except OSError:
+                    data = b""
+                delay = max(0.0, random.gauss(self.latency, self.jitter))
+                if random.random() < self.loss:
+                    delay += self.rto
+                release = max(release, clock_now() + delay)  # Never reorder
+                with cond:
+                    pending.append((release, data))
+                    cond.notify()
+                if not data:
+                    return
+
+        def writer():
+            while True:
+                with cond:
+                    while not pending:
+                        cond.wait()
+                    release, data = pending.pop(0)
+                wait = release - clock_now()
+                if wait > 0:
+                    time.sleep(wait)
+                if not data:
+                    try:
+                        dest.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                try:
+                    dest.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=reader, daemon=True).start()
+        threading.Thread(target=writer, daemon=True).start()
+
+
+def setup_node(control_port, partner_urls, skew=0.0, start_delay=0.0, preroll=True):
+    """Configure this process's engine module as a peer, with a simulated player."""
+    import engine
+
+    simulated = SimulatedPlayer(skew=skew, start_delay=start_delay)
+    engine.player = PlayerActor(simulated)
+    simulated.add_listener(engine.player.on_player_event)
+    engine.session.position = engine.player.get_time
+    engine.drift_corrector = DriftCorrector(engine.player).start()
+    simulated.add_listener(engine.drift_corrector.on_player_event)
+    if preroll:
+        engine.preroll = Preroller(engine.player)
+        simulated.add_listener(engine.preroll.on_player_event)
+    engine.partner_urls = partner_urls
+    engine.load_file_status(BENCH_FINGERPRINT)
+    engine.control_server = AsyncControlServer(
+        engine.handle_control, host="127.0.0.1", port=control_port, on_state=engine.update_partner_state
+    )
+    threading.Thread(target=engine.control_server.serve_forever, daemon=True).start()
+    return engine
+
+
+def run_peer(args):
+    setup_node(args.control_port, args.partner, skew=args.skew, start_delay=args.start_delay)
+    print("ready", flush=True)
+    sys.stdin.read()  # Exit when the host closes our stdin
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+        "mean_ms": statistics.fmean(ordered) * 1000, "n": len(ordered),
+    }
+
+
+def sync_errors(engine):
+    """Each peer's position minus the host's at the same instant, in ms."""
+    errors = []
+    for peer in engine.get_peer_set():
+        reply = peer.channel.request("position", None, timeout=2)
+        if not reply or not peer.clock.synced:
+            continue
+        host_pos = engine.player.player.position_at(peer.clock.to_local(reply["ts"]))
+        errors.append(reply["pos"] - host_pos)
+    return errors
+
+
+def histogram_ms(name):
+    """Median and p95 of a seconds histogram, in ms."""
+    histogram = metrics.histogram(name)
+    if not histogram.count:
+        return {}
+    return {f"p{int(q * 100)}": histogram.quantile(q) * 1000 for q in (0.5, 0.95)} | {"n": histogram.count}
+
+
+def seek_errors():
+    """Partner position error measured by the check that follows each seek."""
+    return histogram_ms("streamer_seek_error_seconds")
+
+
+def message_cost(engine, port, count=2000):
+    """Per-message cost of the control server, without link impairment.
+
+    Sends `count` requests one at a time over loopback, so the round trip
+    is pure client + server overhead; the server-side share comes from
+    the streamer_control_message_seconds histogram.
+    """
+    server = AsyncControlServer(engine.handle_control, host="127.0.0.1", port=port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    channel = ControlChannel("127.0.0.1", port, None).start()
+    channel.wait_connected(5)
+    cost = metrics.histogram("streamer_control_message_seconds")
+    before_sum, before_count = cost.sum, cost.count
+    round_trips = []
+    for _ in range(count):
+        start = clock_now()
+        channel.request("is_file_loaded", timeout=2)
+        round_trips.append(clock_now() - start)
+    channel.close()
+    server.close()
+    handled = cost.count - before_count
+    return {
+        "server_mean_us": (cost.sum - before_sum) / handled * 1e6 if handled else None,
+        "round_trip": percentiles(round_trips),
+    }
+
+
+def run_host(args):
+    host_port = BASE_PORT
+    host_link = BASE_PORT + 1
+    peers, urls = [], []
+    for i in range(args.peers):
+        control_port = BASE_PORT + 10 + 2 * i
+        ImpairedLink(control_port + 1, control_port, args.latency / 2000, args.jitter / 2000, args.loss).start()
+        urls.append(f"tcp://127.0.0.1:{control_port + 1}")
+        peers.append(subprocess.Popen(
+            [sys.executable, __file__, "--peer", "--control-port", str(control_port),
+             "--partner", f"tcp://127.0.0.1:{host_link}", f"--skew={random.uniform(-args.skew, args.skew)}",
+             "--start-delay", str(args.start_delay)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        ))
+    for proc in peers:
+        proc.stdout.readline()  # Wait for "ready"
+    ImpairedLink(host_link, host_port, args.latency / 2000, args.jitter / 2000, args.loss).start()
+    engine = setup_node(host_port, urls, start_delay=args.start_delay, preroll=not args.no_preroll)
+
+    peer_set = engine.get_peer_set()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and not all(peer.clock.synced for peer in peer_set):
+        time.sleep(0.1)
+
+    latencies, start_errors = [], []
+    for i in range(args.rounds):
+        start = clock_now()
+        engine.send_synced_command("seek", lambda: engine.player.set_time(i * 10000), i * 10000)
+        engine.send_synced_command("play", engine.player.play, require_loaded=True)
+        latencies.append((clock_now() - start) / 2)
+        time.sleep(0.5)
+        start_errors.extend(sync_errors(engine))
+        engine.send_synced_command("pause", engine.player.pause, require_loaded=True)
+
+    # Cold starts and long jumps during playback, where decoders spin up at different speeds
+    cold_errors = []
+    for i in range(args.rounds):
+        engine.send_synced_command("stop", engine.player.stop, require_loaded=True)
+        time.sleep(0.5)  # Let the scheduled stop land first
+        engine.send_synced_command("play", engine.player.play, require_loaded=True)
+        time.sleep(0.5)
+        cold_errors.extend(sync_errors(engine))
+        engine.send_synced_command("seek", lambda: engine.player.set_time(600000), 600000)
+        time.sleep(0.5)
+        cold_errors.extend(sync_errors(engine))
+    engine.send_synced_command("pause", engine.player.pause, require_loaded=True)
+
+    sent, start = 0, clock_now()
+    while clock_now() - start < args.throughput_seconds:
+        engine.send_command("seek", sent % 3600 * 1000)
+        sent += 1
+    commands_per_sec = sent / (clock_now() - start)
+
+    engine.send_synced_command("seek", lambda: engine.player.set_time(0), 0)
+    engine.send_synced_command("play", engine.player.play, require_loaded=True)
+    time.sleep(args.settle)
+    settled_errors = sync_errors(engine)
+
+    results = {
+        "config": vars(args),
+        "python": platform.python_version(),
+        "command_latency": percentiles(latencies),
+        "commands_per_sec": commands_per_sec,
+        "start_sync_error": percentiles([abs(e) / 1000 for e in start_errors]),
+        "cold_start_sync_error": percentiles([abs(e) / 1000 for e in cold_errors]),
+        "preroll_ms": histogram_ms("streamer_preroll_seconds"),
+        "player_queue_ms": histogram_ms("streamer_player_queue_seconds"),
+        "settled_sync_error": percentiles([abs(e) / 1000 for e in settled_errors]),
+        "clock_rtt_ms": {peer.url: peer.clock.rtt * 1000 for peer in peer_set if peer.clock.synced},
+        "seek_error_ms": seek_errors(),
+        "control_message_cost": message_cost(engine, BASE_PORT + 2),
+    }
+    for proc in peers:
+        proc.stdin.close()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({key: results[key] for key in ("command_latency", "commands_per_sec", "start_sync_error", "cold_start_sync_error", "preroll_ms", "player_queue_ms", "settled_sync_error", "seek_error_ms")}, indent=2))
+    print(f"Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--peers", type=int, default=2, help="number of partner processes")
+    parser.add_argument("--latency", type=float, default=20.0, help="round-trip latency to inject, ms")
+    parser.add_argument("--jitter", type=float, default=5.0, help="round-trip jitter (std dev), ms")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability a segment needs a retransmit")
+    parser.add_argument("--skew", type=float, default=0.0005, help="max player clock skew, fraction")
+    parser.add_argument("--start-delay", type=float, default=0.02, help="max decoder start delay, s")
+    parser.add_argument("--no-preroll", action="store_true", help="start cold, without the ready barrier")
+    parser.add_argument("--rounds", type=int, default=10, help="seek/play/pause rounds")
+    parser.add_argument("--throughput-seconds", type=float, default=3.0)
+    parser.add_argument("--settle", type=float, default=5.0, help="seconds of playback before the final sync check")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--peer", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--control-port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--partner", action="append", default=[], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.peer:
+        run_peer(args)
+    else:
+        run_host(args)
+
+
+if __name__ == "__main__":
+    main()
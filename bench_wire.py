@@ -0,0 +1,105 @@
+"""Codec micro-benchmark: JSON frames against the binary wire format.
+
+Encodes and decodes the messages that dominate control traffic: synced
+commands, their acks, position heartbeats, clock probes and state pushes.
+Each is timed on its own as a single-message frame, and then as a batch
+that shares one binary frame where JSON needs a frame per message. Times
+are per message, in microseconds. Results are written as JSON.
+
+    python bench_wire.py --repeat 5
+"""
+import argparse
+import json
+import platform
+import timeit
+
+from control import _header, encode_frame, encode_frames
+from wire import WIRE_VERSION, decode
+
+NODE = "3f9a0c7e51b2"
+FINGERPRINT = "2c4a9f00-" + "9e107d9d372bb6826bd81d3542a419d6" * 2
+ACK_TAGS = {"node": NODE, "file_loaded": True, "fingerprint": FINGERPRINT}  # Added to every engine ack
+
+MESSAGES = {
+    "seek_cmd": {
+        "type": "cmd", "id": 4182, "action": "seek", "params": 3725000, "at": 18234.512345,
+        "origin": NODE, "require_loaded": True, "seq": 77, "fingerprint": FINGERPRINT, "playing": True,
+    },
+    "play_cmd": {
+        "type": "cmd", "id": 4183, "action": "play", "params": None, "at": 18235.1,
+        "origin": NODE, "require_loaded": True, "seq": 78, "fingerprint": FINGERPRINT,
+    },
+    "seek_ack": dict(ACK_TAGS, type="ack", id=4182, status="success", action="seek", at=18234.512345),
+    "position_cmd": {"type": "cmd", "id": 4190, "action": "position", "params": None},
+    "position_ack": dict(
+        ACK_TAGS, type="ack", id=4190, status="success", pos=3731042, ts=18240.000211, playing=True, rate=1.0,
+    ),
+    "clock_cmd": {"type": "cmd", "id": 4191, "action": "clock", "params": None},
+    "clock_ack": dict(ACK_TAGS, type="ack", id=4191, status="success", recv=18240.101234, send=18240.101239),
+    "state": {"type": "state", "state": {"node": NODE, "file_loaded": True, "fingerprint": FINGERPRINT}},
+}
+
+
+def per_message_us(fn, messages, repeat):
+    """Best-of-`repeat` time of fn(), divided over the messages it handles, in µs."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number / messages * 1e6
+
+
+def payloads(stream):
+    """Split an encoded byte stream back into frame payloads."""
+    offset = 0
+    while offset < len(stream):
+        (size,) = _header.unpack_from(stream, offset)
+        offset += _header.size
+        yield stream[offset:offset + size]
+        offset += size
+
+
+def measure(messages, repeat):
+    """Encode and decode costs and bytes per message, for JSON and binary."""
+    results = {}
+    for name, version in (("json", 0), ("binary", WIRE_VERSION)):
+        stream = encode_frames(messages, version)
+        frames = list(payloads(stream))
+        decoded = [message for payload in frames for message in decode(payload)]
+        assert decoded == messages, f"{name} round trip changed the messages"
+        if len(messages) == 1:
+            encode = lambda: encode_frame(messages[0], version)
+        else:
+            encode = lambda: encode_frames(messages, version)
+        results[name] = {
+            "encode_us": per_message_us(encode, len(messages), repeat),
+            "decode_us": per_message_us(lambda: [decode(payload) for payload in frames], len(messages), repeat),
+            "bytes": len(stream) / len(messages),
+            "frames": len(frames),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="timing repeats; the best is kept")
+    parser.add_argument("--output", default="bench_wire.json")
+    args = parser.parse_args()
+
+    results = {
+        "python": platform.python_version(),
+        "wire_version": WIRE_VERSION,
+        "messages": {name: measure([message], args.repeat) for name, message in MESSAGES.items()},
+        "batch": measure(list(MESSAGES.values()), args.repeat),
+    }
+    print(f"{'per message':<14} {'encode µs':>17} {'decode µs':>17} {'bytes':>15}")
+    print(f"{'':<14} {'json':>8} {'binary':>8} {'json':>8} {'binary':>8} {'json':>7} {'binary':>7}")
+    for name, result in list(results["messages"].items()) + [(f"batch of {len(MESSAGES)}", results["batch"])]:
+        j, b = result["json"], result["binary"]
+        print(f"{name:<14} {j['encode_us']:8.2f} {b['encode_us']:8.2f} {j['decode_us']:8.2f} {b['decode_us']:8.2f}"
+              f" {j['bytes']:7.1f} {b['bytes']:7.1f}")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+def clock_now():
+    """Local clock used for all sync timestamps, in seconds."""
+    return time.monotonic()
+
+
+class ClockSync:
+    """NTP-style estimate of a partner's clock offset and the link RTT.
+
+    `request` is a control channel's request function; the partner answers
+    the "clock" command with its receive and send timestamps. Each probe
+    gives one offset/RTT sample, the lowest-RTT sample in a sliding window
+    is the least disturbed by queueing, and the estimate is smoothed over
+    those best samples.
+    """
+
+    def __init__(self, request, interval=2.0, window=8, alpha=0.3):
+        self.request = request
+        self.interval = interval
+        self.window = window
+        self.alpha = alpha
+        self.samples = []
+        self.offset = None  # partner clock minus local clock, in seconds
+        self.rtt = None
+        self._stopped = threading.Event()
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def probe(self):
+        """Take one offset/RTT sample; returns False if the partner did not answer."""
+        t0 = clock_now()
+        reply = self.request("clock", None, timeout=2)
+        t3 = clock_now()
+        if not reply or "recv" not in reply:
+            return False
+        t1, t2 = reply["recv"], reply["send"]
+        rtt = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2
+        self.samples.append((rtt, offset))
+        del self.samples[:-self.window]
+        best_rtt, best_offset = min(self.samples)
+        if self.offset is None:
+            self.offset, self.rtt = best_offset, best_rtt
+        else:
+            self.offset += self.alpha * (best_offset - self.offset)
+            self.rtt += self.alpha * (best_rtt - self.rtt)
+        return True
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        # A quick burst fills the window, then probe at the regular interval
+        for _ in range(self.window):
+            if self._stopped.is_set():
+                return
+            self.probe()
+            self._stopped.wait(0.05)
+        while not self._stopped.wait(self.interval):
+            self.probe()
+
+    def stop(self):
+        self._stopped.set()
+
+    def to_remote(self, local_ts):
+        return local_ts + self.offset
+
+    def to_local(self, remote_ts):
+        return remote_ts - self.offset
+
+    def lead_time(self):
+        """How far ahead to schedule a command so it reaches the partner in time."""
+        return min(max(1.5 * self.rtt + 0.03, 0.05), 1.0)
+
+
+class Scheduler:
+    """Run callbacks at local clock timestamps with millisecond precision.
+
+    OS timers are coarse (about 15 ms on Windows), so the worker sleeps
+    until just before the deadline and spins for the last stretch.
+    """
+
+    SPIN = 0.003
+
+    def __init__(self):
+        self._queue = []
+        self._ids = itertools.count()
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def call_at(self, when, fn):
+        with self._cond:
+            heapq.heappush(self._queue, (when, next(self._ids), fn))
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                when, _, fn = self._queue[0]
+                remaining = when - clock_now()
+                if remaining > self.SPIN:
+                    self._cond.wait(remaining - self.SPIN)
+                    continue
+                heapq.heappop(self._queue)
+            while clock_now() < when:
+                pass
+            try:
+                fn()
+            except Exception as e:
+                print(f"Scheduled command failed: {e}")
@@ -0,0 +1,79 @@
+import threading
+
+from clocksync import clock_now
+
+TRANSPORT = ("play", "pause")
+
+
+class QueuedCommand:
+    def __init__(self, command, local_action, params=None):
+        self.command = command
+        self.local_action = local_action
+        self.params = params
+
+
+class CommandQueue:
+    """Ordered outbox that collapses bursts of commands into their final state.
+
+    One worker thread sends commands one at a time. Anything queued while a
+    send is in flight is merged first: a new seek replaces any queued
+    seek, a repeated play is dropped, play after pause replaces the pause,
+    and two pauses (VLC toggles) cancel out. Seeks also wait for a short
+    quiet period, so scrubbing sends one message and does one decoder seek
+    on each side.
+    """
+
+    def __init__(self, execute, debounce=0.15):
+        self.execute = execute  # execute(command, local_action, params), blocking
+        self.debounce = debounce
+        self.merged = 0
+        self._pending = []
+        self._last_seek = 0.0
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def put(self, command, local_action, params=None):
+        item = QueuedCommand(command, local_action, params)
+        with self._cond:
+            before = len(self._pending)
+            self._merge(item)
+            self.merged += before + 1 - len(self._pending)
+            self._cond.notify()
+
+    def _merge(self, item):
+        pending = self._pending
+        if item.command == "seek":
+            self._last_seek = clock_now()
+            pending[:] = [queued for queued in pending if queued.command != "seek"]
+        elif item.command == "stop":
+            pending.clear()  # Nothing queued before a stop matters
+        elif item.command in TRANSPORT:
+            last = next((queued for queued in reversed(pending) if queued.command in TRANSPORT), None)
+            if last is not None:
+                if item.command == "play":
+                    pending.remove(last)  # Playing is the final state either way
+                elif last.command == "pause":
+                    pending.remove(last)  # Two pause toggles cancel out
+                    return
+        pending.append(item)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                head = self._pending[0]
+                if head.command == "seek":
+                    quiet = self._last_seek + self.debounce - clock_now()
+                    if quiet > 0:
+                        self._cond.wait(quiet)  # Still scrubbing; let later seeks replace this one
+                        continue
+                self._pending.pop(0)
+            try:
+                self.execute(head.command, head.local_action, head.params)
+            except Exception as e:
+                print(f"Failed to send command {head.command}: {e}")
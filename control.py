@@ -0,0 +1,268 @@
+import itertools
+import json
+import socket
+import struct
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+from wire import MAX_BATCH, WIRE_VERSION, decode, encode
+
+CONTROL_PORT = 5001  # Served next to the waitress app on 5000
+
+_header = struct.Struct("!I")  # 4-byte big-endian frame length
+MAX_FRAME = 1 << 20
+_ENVELOPE = ("type", "id", "action", "params")
+
+
+def encode_frame(message, version=0):
+    """Encode a message dict as a length-prefixed frame: JSON, or binary (wire.py) from version 1."""
+    if version:
+        payload = encode([message])
+    else:
+        payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return _header.pack(len(payload)) + payload
+
+
+def encode_frames(messages, version=0):
+    """Encode messages for one write: a JSON frame each, or binary frames of up to MAX_BATCH."""
+    if not version:
+        return b"".join(encode_frame(message) for message in messages)
+    payloads = [encode(messages[i:i + MAX_BATCH]) for i in range(0, len(messages), MAX_BATCH)]
+    return b"".join(_header.pack(len(payload)) + payload for payload in payloads)
+
+
+def wire_reply(message):
+    """Agree on the wire version a peer offered; (version to send in, reply or None)."""
+    version = min(int(message.get("version", 0)), WIRE_VERSION)
+    return version, {"type": "wire", "version": version} if message.get("offer") else None
+
+
+def _recv_exact(sock, size):
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise ConnectionError("Control connection closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def read_messages(sock):
+    """Read one frame from the socket and decode the messages in it."""
+    (size,) = _header.unpack(_recv_exact(sock, _header.size))
+    if size > MAX_FRAME:
+        raise ConnectionError(f"Control frame too large: {size} bytes")
+    return decode(_recv_exact(sock, size))
+
+
+def control_address(url):
+    """Map a partner URL to the (host, port) of its control server, or None if it has none.
+
+    A tcp:// URL names the server directly. A bare host or http:// URL is a
+    direct address, with the server on CONTROL_PORT next to the HTTP one.
+    An https:// URL is a tunnel or proxy, e.g. a devtunnel, that relays only
+    HTTPS to port 5000, so such partners get no channel and stay on HTTP.
+    """
+    parsed = urlparse(url if "://" in url else f"http://{url}")
+    if parsed.scheme == "tcp":
+        return parsed.hostname, parsed.port or CONTROL_PORT
+    if parsed.scheme == "http":
+        return parsed.hostname, CONTROL_PORT
+    return None
+
+
+class Connection:
+    """One framed control connection, usable from either end.
+
+    Both sides can issue commands and wait for their acks, and push
+    state messages that need no reply. Frames go out as JSON until the
+    two ends agree on the binary format: the connecting side offers it
+    with `offer_binary`, and an end that predates it ignores the offer.
+    Messages sent from several threads at once share a frame.
+    """
+
+    def __init__(self, sock, handler=None, on_state=None):
+        self.sock = sock
+        self.handler = handler
+        self.on_state = on_state
+        self.closed = False
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._send_lock = threading.Lock()
+        self._outbox = deque()
+        self.version = 0  # Wire format we send in; decoding accepts either
+        if sock.family in (socket.AF_INET, socket.AF_INET6):  # Not for the engine's Unix socket
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    def send(self, message):
+        self.send_many([message])
+
+    def send_many(self, messages):
+        """Send messages, in one frame with any that other threads queued meanwhile."""
+        self._outbox.extend(messages)
+        with self._send_lock:
+            batch = []
+            while self._outbox:
+                batch.append(self._outbox.popleft())
+            if batch:
+                self.sock.sendall(encode_frames(batch, self.version))
+
+    def offer_binary(self):
+        try:
+            self.send({"type": "wire", "version": WIRE_VERSION, "offer": True})
+        except OSError:
+            pass
+
+    def request(self, action, params=None, timeout=5, **fields):
+        """Send a command and block until it is acked; None on timeout.
+
+        Extra fields (e.g. `at`, a partner-clock timestamp to execute the
+        command at) travel in the message and are passed to the handler.
+        """
+        msg_id = next(self._ids)
+        waiter = [threading.Event(), None]
+        self._pending[msg_id] = waiter
+        message = {"type": "cmd", "id": msg_id, "action": action, "params": params}
+        message.update((k, v) for k, v in fields.items() if v is not None)
+        try:
+            self.send(message)
+            if waiter[0].wait(timeout):
+                return waiter[1]
+            return None
+        except OSError:
+            return None
+        finally:
+            self._pending.pop(msg_id, None)
+
+    def push_state(self, state):
+        try:
+            self.send({"type": "state", "state": state})
+        except OSError:
+            pass
+
+    def serve(self):
+        """Read frames until the connection drops."""
+        try:
+            while True:
+                replies = [reply for reply in map(self._dispatch, read_messages(self.sock)) if reply is not None]
+                if replies:
+                    self.send_many(replies)  # Acks for a batch share a frame too
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.close()
+
+    def _dispatch(self, message):
+        kind = message.get("type")
+        if kind == "ack":
+            waiter = self._pending.get(message.get("id"))
+            if waiter:
+                waiter[1] = message
+                waiter[0].set()
+        elif kind == "cmd":
+            reply = {"status": "error", "message": "No command handler"}
+            if self.handler:
+                fields = {k: v for k, v in message.items() if k not in _ENVELOPE}
+                try:
+                    reply = self.handler(message["action"], message.get("params"), **fields)
+                except Exception as e:  # A bad command must not stop the reader
+                    reply = {"status": "error", "message": str(e)}
+            return dict(reply, type="ack", id=message.get("id"))
+        elif kind == "state" and self.on_state:
+            self.on_state(message.get("state"))
+        elif kind == "wire":
+            self.version, reply = wire_reply(message)
+            return reply
+        return None
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        for waiter in list(self._pending.values()):
+            waiter[0].set()
+
+
+class ControlChannel:
+    """Long-lived connection to a partner's control server.
+
+    A background thread keeps the connection open and reconnects with
+    backoff whenever it drops, or whenever reading from it fails. A
+    channel for a URL with no control server (see control_address) never
+    connects, and its requests return None. `on_connect`, if given, runs
+    on its own thread after every (re)connect, e.g. to rejoin a relay hub
+    room.
+    """
+
+    def __init__(self, host, port=CONTROL_PORT, handler=None, on_state=None, on_connect=None):
+        self.address = (host, port)
+        self.url = None
+        self.handler = handler
+        self.on_state = on_state
+        self.on_connect = on_connect
+        self.conn = None
+        self._stopped = threading.Event()
+        self._connected = threading.Event()
+
+    @classmethod
+    def for_url(cls, url, **kwargs):
+        host, port = control_address(url) or (None, CONTROL_PORT)
+        channel = cls(host, port, **kwargs)
+        channel.url = url
+        return channel
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        if self.address[0] is not None:
+            threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        delay = 0.2
+        while not self._stopped.is_set():
+            try:
+                sock = socket.create_connection(self.address, timeout=5)
+                sock.settimeout(None)
+            except OSError:
+                self._stopped.wait(delay)
+                delay = min(delay * 2, 5.0)  # Back off while the partner is down
+                continue
+            delay = 0.2
+            self.conn = Connection(sock, self.handler, self.on_state)
+            self.conn.offer_binary()
+            self._connected.set()
+            if self.on_connect:
+                threading.Thread(target=self.on_connect, daemon=True).start()
+            try:
+                self.conn.serve()
+            except Exception as e:
+                print(f"Control channel to {self.address[0]}:{self.address[1]} failed: {e!r}")
+            finally:
+                self._connected.clear()
+                self.conn.close()
+
+    def wait_connected(self, timeout):
+        return self._connected.wait(timeout)
+
+    def request(self, action, params=None, timeout=5, **fields):
+        """Send a command over the channel; None if it could not be delivered."""
+        conn = self.conn
+        if not self.connected or conn is None:
+            return None
+        return conn.request(action, params, timeout, **fields)
+
+    def push_state(self, state):
+        if self.connected and self.conn:
+            self.conn.push_state(state)
+
+    def close(self):
+        self._stopped.set()
+        if self.conn:
+            self.conn.close()
@@ -0,0 +1,55 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Dispatcher:
+    """Run blocking network work off the Tk thread.
+
+    Jobs run on a small worker pool and their results, like any other UI
+    update made from a worker, are queued and applied on the Tk thread by a
+    `root.after` pump. Tk itself is never touched from a worker.
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=15):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dispatch")
+        self._ui_calls = queue.SimpleQueue()
+        self.root.after(self.poll_ms, self._pump)
+
+    def submit(self, fn, *args, on_done=None, on_error=None):
+        """Run fn(*args) on a worker; on_done(result) then runs on the Tk thread."""
+        future = self._pool.submit(fn, *args)
+
+        def deliver(done):
+            try:
+                result = done.result()
+            except Exception as e:
+                print(f"Background command failed: {e}")
+                if on_error:
+                    self.call_soon(on_error, e)
+                return
+            if on_done:
+                self.call_soon(on_done, result)
+
+        future.add_done_callback(deliver)
+        return future
+
+    def call_soon(self, fn, *args):
+        """Schedule fn(*args) on the Tk thread; safe to call from any thread."""
+        self._ui_calls.put((fn, args))
+
+    def _pump(self):
+        try:
+            while True:
+                fn, args = self._ui_calls.get_nowait()
+                try:
+                    fn(*args)
+                except Exception as e:
+                    print(f"UI update failed: {e}")
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._pump)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,879 @@
+"""Headless engine: owns the player, partner networking and sync.
+
+Frontends (streamer.py, the Tk GUI; app.py, the terminal menu) drive it
+over a local IPC socket (ipc.py) and can come and go while it keeps
+playing. A frontend starts the engine if none is running; run this
+module directly to start it by hand, or with --stop to shut it down.
+"""
+import startup
+import os
+import sys
+import argparse
+from threading import Thread
+import warnings
+import logging
+import time
+import threading
+import itertools
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from aioserver import AsyncControlServer
+from clocksync import Scheduler, clock_now
+from peers import PeerSet, parse_peer_urls
+from lan import LanEndpoint
+from commandqueue import CommandQueue
+from fingerprint import CACHE_DIR, Fingerprinter
+from ipc import EngineClient, connect_engine, engine_address
+from keyframes import KeyframeStore
+from transfer import Downloader, ManifestStore
+from streamcache import StreamCache
+import metrics
+from session import Session
+from sync import DriftCorrector
+
+
+player = None
+partner_urls = []
+file_loaded = False
+local_fingerprint = None  # Content fingerprint of the loaded media
+fingerprinter = Fingerprinter()
+media_path = None  # File offered to partners for download
+manifest_store = ManifestStore()
+keyframe_store = KeyframeStore()
+stream_cache = None  # Partner media being streamed through /stream
+node_id = uuid.uuid4().hex[:12]  # Identifies this peer in command origins and acks
+control_server = None
+lan_endpoint = None  # UDP discovery and control on the local network; None if unavailable
+peer_set = None
+peer_lock = threading.Lock()
+drift_corrector = None
+preroll = None  # Warms the decoder before synchronized starts
+player_events = None  # libvlc event stream shared by frontends and sync logic
+command_queue = None
+ipc_server = None  # Frontends connected over the local IPC socket
+workers = ThreadPoolExecutor(max_workers=4, thread_name_prefix="engine")  # Blocking network and disk work
+partner_text = ""  # Partner URLs as entered, shown again by frontends that connect later
+media_name = None  # What is loaded, for frontends
+status_text = "Starting..."
+warm = threading.Event()  # Set once warm-up has created the player and started the servers
+warm_up_error = None  # Why warm-up could not create the player, if it failed
+command_seq = itertools.count(1)  # Orders the commands we send
+last_seq = {}  # origin node id -> highest command seq applied
+seq_lock = threading.Lock()
+scheduler = Scheduler()
+SEEK_SETTLE = 0.3  # Seconds for decoders to land after a seek before positions are compared
+SEEK_TOLERANCE = 0.08  # Seek error left alone, about two frames at 25 fps
+PREROLL_SEEK = 10000  # ms; a seek this far while playing goes through the ready barrier
+PREROLL_DEADLINE = 8.0  # Seconds the host waits for partners to report ready
+PREROLL_POLL = 0.05
+session = Session()  # Our playback state and journal, for partners that join late
+partner_sessions = {}  # partner node id -> its session state as last caught up
+preroll_seconds = metrics.histogram("streamer_preroll_seconds", "Time for every player to report ready")
+preroll_stragglers = metrics.counter("streamer_preroll_stragglers_total", "Partners not ready by the barrier deadline")
+seek_errors = metrics.histogram("streamer_seek_error_seconds", "Partner position error after a seek")
+
+
+log = logging.getLogger('werkzeug')
+log.setLevel(logging.ERROR)
+
+warnings.filterwarnings("ignore")
+
+def is_stale(origin, seq):
+    """True if a newer command from the same sender has already been accepted."""
+    if seq is None:
+        return False
+    with seq_lock:
+        if seq <= last_seq.get(origin, 0):
+            return True
+        last_seq[origin] = seq
+        return False
+
+def apply_command(action, params=None, at=None, origin=None, require_loaded=False, seq=None, fingerprint=None,
+                  playing=None, due=None):
+    """Apply a partner command to the local player; shared by HTTP and control channel.
+
+    With `require_loaded` the command is rejected, without touching the
+    player, unless our media is loaded and has the sender's fingerprint,
+    so the sender needs no separate status check before it. Commands that
+    arrive after a newer one from the same sender are acked but dropped.
+    `playing` is the sender's play state, sent with seeks.
+    """
+    if action == "clock":
+        received = clock_now()
+        return {"status": "success", "recv": received, "send": clock_now()}
+    if require_loaded and not file_loaded:
+        return {"status": "error", "reason": "not_ready", "message": "File not loaded"}
+    if require_loaded and fingerprint and local_fingerprint and fingerprint != local_fingerprint:
+        return {"status": "error", "reason": "mismatch", "message": "A different file is loaded"}
+    if is_stale(origin, seq):
+        return {"status": "success", "action": action, "stale": True}
+    if action == "seek" and due is None:
+        prefetch_keyframe(int(params))  # Start fetching while the seek waits for its time
+    if at is not None:
+        # Execute at the shared timestamp chosen by the sender
+        scheduler.call_at(at, lambda: apply_command(
+            action, params, origin=origin, require_loaded=require_loaded, playing=playing, due=at
+        ))
+        return {"status": "success", "action": action, "at": at}
+    if action == "load_file":
+        # A partner announcing its file; the ack tells it whether ours matches
+        return {"status": "success", "action": "file loaded", "match": fingerprint == local_fingerprint}
+    if action == "is_file_loaded":
+        return {"status": "success", "file_loaded": file_loaded}
+    if action == "catch_up":
+        return dict(session.catch_up(params), status="success")
+    if not player:
+        return {"status": "error", "message": "Player not initialized"}
+    if action == "ready":
+        return dict(preroll.status(), status="success")
+    if action == "position":
+        return {
+            "status": "success",
+            "pos": player.get_time(),
+            "ts": clock_now(),
+            "playing": bool(player.is_playing()),
+            "rate": player.get_rate(),
+        }
+    leader = peer_set.by_node(origin) if peer_set else None
+    if drift_corrector and leader:
+        drift_corrector.follow(leader.clock, leader.channel_request)  # The partner issued this command, so it leads
+    if action == "play":
+        player.play()
+    elif action == "pause":
+        player.pause()
+    elif action == "seek":
+        target = seek_target(int(params), playing, due)
+        player.set_time(target)  # Seek to the absolute time, in ms
+        session.record(action, target)
+        return {"status": "success", "action": "seek", "time": target}
+    elif action == "stop":
+        player.stop()
+    elif action == "prepare":
+        preroll.begin(int(params))  # Acked now; the host polls "ready" until the warm-up is done
+        session.record("sync", (int(params), False, player.get_rate()))
+        return {"status": "success", "action": "prepare", "target": int(params)}
+    else:
+        return {"status": "error", "message": f"Unknown command: {action}"}
+    session.record(action)
+    return {"status": "success", "action": action}
+
+def current_keyframes():
+    """Keyframe index of the loaded media: ours, or the partner's while streaming; None if unknown."""
+    if stream_cache:
+        return stream_cache.keyframes
+    if media_path and local_fingerprint:
+        return keyframe_store.get(media_path, local_fingerprint)
+    return None
+
+def snap_to_keyframe(ms):
+    """Move a seek target back onto the keyframe just before it, if one is close.
+
+    The sender snaps before fanning out, so every peer decodes from the
+    same keyframe and lands on the same frame, instead of each player
+    resolving an in-between target on its own.
+    """
+    index = current_keyframes()
+    return index.snap(ms) if index else ms
+
+def prefetch_keyframe(ms):
+    """While streaming, fetch the chunks the player needs to resume at `ms`."""
+    index = current_keyframes()
+    if stream_cache and index:
+        stream_cache.prefetch(index.offsets_from(ms))
+
+def seek_target(ms, playing, due=None):
+    """Where to seek so we land where a playing sender is, not where it was.
+
+    A scheduled seek that runs after its due time, because it arrived late
+    or the scheduler woke late, moves forward by the lateness.
+    """
+    if not playing or due is None:
+        return ms
+    late = clock_now() - due
+    return ms + int(max(0.0, late) * 1000 * player.get_rate())
+
+def ack(reply):
+    """Tag a command reply with our node id and load state, so partners never have to ask."""
+    return dict(reply, node=node_id, file_loaded=file_loaded, fingerprint=local_fingerprint)
+
+def load_file_status(fingerprint=None, path=None):
+    """Mark our media as loaded and tell connected partners which file it is."""
+    global file_loaded, local_fingerprint, media_path
+    file_loaded = True
+    local_fingerprint = fingerprint
+    media_path = path
+    session.record("load", fingerprint=fingerprint)
+    if path and fingerprint:
+        keyframe_store.get(path, fingerprint)  # Start indexing now, so it is ready for the first seek
+    state = {"node": node_id, "file_loaded": True, "fingerprint": fingerprint}
+    if control_server:
+        control_server.push_state(state)  # Partners learn without asking
+    if lan_endpoint:
+        lan_endpoint.push_state(state)
+    return {"status": "success", "action": "file loaded"}
+
+def create_app():
+    """The HTTP API: partners' fallback transport, media downloads and the stream proxy.
+
+    Built during warm-up, so Flask is only imported after frontends can connect.
+    """
+    from flask import Flask, Response, jsonify, request, send_file
+
+    app = Flask(__name__)
+    app.logger.disabled = True
+
+    def command_args():
+        """Read the optional command fields of an HTTP fallback request."""
+        return {
+            "at": request.args.get("at", type=float),
+            "origin": request.args.get("origin"),
+            "require_loaded": request.args.get("require_loaded", 0, type=int) == 1,
+            "seq": request.args.get("seq", type=int),
+            "fingerprint": request.args.get("fingerprint"),
+            "playing": request.args.get("playing", type=int) == 1 if "playing" in request.args else None,
+        }
+
+    @app.route('/play')
+    def remote_play():
+        return jsonify(ack(apply_command("play", **command_args())))
+
+    @app.route('/pause')
+    def remote_pause():
+        return jsonify(ack(apply_command("pause", **command_args())))
+
+    @app.route('/seek/<int:seconds>')
+    def remote_seek(seconds):
+        ms = request.args.get("ms", seconds * 1000, type=int)  # Peers that predate ?ms= send whole seconds
+        return jsonify(ack(apply_command("seek", ms, **command_args())))
+
+    @app.route('/prepare/<int:ms>')
+    def remote_prepare(ms):
+        return jsonify(ack(apply_command("prepare", ms, **command_args())))
+
+    @app.route('/ready')
+    def remote_ready():
+        return jsonify(ack(apply_command("ready")))
+
+    @app.route('/clock')
+    def remote_clock():
+        return jsonify(ack(apply_command("clock")))
+
+    @app.route('/position')
+    def remote_position():
+        return jsonify(ack(apply_command("position")))
+
+    @app.route('/stop')
+    def remote_stop():
+        return jsonify(ack(apply_command("stop", **command_args())))
+
+    @app.route('/sync_stats')
+    def sync_stats():
+        if not drift_corrector:
+            return jsonify({"status": "error", "message": "Not connected to a partner"})
+        return jsonify(dict(drift_corrector.stats(), status="success"))
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.route('/is_file_loaded')
+    def is_file_loaded():
+        return jsonify(ack(apply_command("is_file_loaded")))
+
+    @app.route('/catch_up')
+    @app.route('/catch_up/<int:since>')
+    def catch_up(since=None):
+        return jsonify(ack(apply_command("catch_up", since)))
+
+    @app.route('/load_file', methods=['POST'])
+    def load_file():
+        return jsonify(ack(apply_command("load_file", **command_args())))
+
+    @app.route('/media')
+    def media():
+        """Serve the loaded file with Range support for partner downloads and streaming."""
+        if not media_path:
+            return jsonify({"status": "error", "message": "No media loaded"}), 404
+        # conditional=True answers Range requests with 206; the body goes through
+        # the server's wsgi.file_wrapper, so it streams from disk without buffering in Python
+        return send_file(media_path, conditional=True)
+
+    @app.route('/media/manifest')
+    def media_manifest():
+        if not media_path or not local_fingerprint:
+            return jsonify({"status": "error", "message": "No media loaded"}), 404
+        manifest = manifest_store.get(media_path, local_fingerprint)
+        if manifest is None:
+            return jsonify({"status": "pending", "message": "Hashing media"}), 503
+        return jsonify(manifest)
+
+    @app.route('/media/keyframes')
+    def media_keyframes():
+        """Keyframe times and offsets of the loaded file, for partners that stream it."""
+        if not media_path or not local_fingerprint:
+            return jsonify({"status": "error", "message": "No media loaded"}), 404
+        index = keyframe_store.get(media_path, local_fingerprint)
+        if index is None and not keyframe_store.done(local_fingerprint):
+            return jsonify({"status": "pending", "message": "Indexing keyframes"}), 503
+        if index is None:
+            return jsonify({"status": "error", "message": "No keyframe index for this format"}), 404
+        return jsonify(index.to_json())
+
+    @app.route('/stream')
+    def stream():
+        """Local proxy VLC plays from while streaming: bytes come from the chunk cache."""
+        if not stream_cache:
+            return jsonify({"status": "error", "message": "Not streaming"}), 404
+        size = stream_cache.size
+        headers = {"Accept-Ranges": "bytes"}
+        start, stop, status = 0, size, 200
+        byte_range = request.range.range_for_length(size) if request.range else None
+        if byte_range:
+            (start, stop), status = byte_range, 206
+            headers["Content-Range"] = f"bytes {start}-{stop - 1}/{size}"
+        headers["Content-Length"] = str(stop - start)
+        return Response(stream_cache.read(start, stop - 1), status=status, headers=headers,
+                        mimetype="application/octet-stream", direct_passthrough=True)
+
+    return app
+
+def start_server():
+    from waitress import serve
+    serve(create_app(), host='0.0.0.0', port=5000)
+
+def update_partner_state(state):
+    """Record load state pushed by a partner against its peer entry."""
+    peer = peer_set.by_node(state.get("node")) if peer_set and state else None
+    if peer and "file_loaded" in state:
+        peer.file_loaded = state["file_loaded"]
+        peer.fingerprint = state.get("fingerprint")
+
+def handle_control(action, params=None, **fields):
+    """Control channel handler: apply the command and tag the ack."""
+    return ack(apply_command(action, params, **fields))
+
+def start_control_server():
+    """Serve the persistent control channel next to the HTTP routes."""
+    global control_server
+    control_server = AsyncControlServer(handle_control, on_state=update_partner_state)
+    control_server.serve_forever()
+
+def start_lan(on_discover=None):
+    """Start LAN discovery; without it partners are reached over TCP and HTTP as before."""
+    global lan_endpoint
+    try:
+        lan_endpoint = LanEndpoint(handle_control, node_id, on_state=update_partner_state, on_discover=on_discover).start()
+    except OSError as e:
+        print(f"LAN mode unavailable: {e}")
+
+def get_peer_set():
+    """Return the session's peer set, synced with the partner URLs entered."""
+    global peer_set
+    with peer_lock:
+        if peer_set is None:
+            peer_set = PeerSet(handle_control, on_state=update_partner_state, lan=lan_endpoint)
+        peer_set.update(partner_urls)
+    return peer_set
+
+def notify(kind, **event):
+    """Push an event to every connected frontend; safe from any thread."""
+    if ipc_server:
+        ipc_server.push_state(dict(event, kind=kind))
+
+def set_status(text):
+    """Update the status line every frontend shows."""
+    global status_text
+    status_text = text
+    notify("status", text=text)
+
+def notice(level, text):
+    """Tell frontends something worth a dialog: level is info, warning or error."""
+    print(f"{level.capitalize()}: {text}")
+    notify("notice", level=level, text=text)
+
+def send_command(command, params=None, local_at=None, require_loaded=False, **fields):
+    """Fan a command out to every partner at once; True if any of them acked.
+
+    Blocks on the network, so it runs on the command queue or a worker.
+    """
+    if not partner_urls:
+        set_status("Partner URL not set.")
+        return False  # Indicate failure to send the command
+
+    set_status("Trying to connect with partners...")
+    result = get_peer_set().fanout(
+        command, params, local_at=local_at, origin=node_id,
+        require_loaded=require_loaded, seq=next(command_seq), **fields,
+    )
+    if not result.ok:
+        print(f"{command}: {result.summary()}")  # Failures and stragglers only; the rest is in the metrics
+    if result.rejected and not result.acked:
+        set_status("Partners have not loaded the same file.")
+        return False
+    if not result.acked:
+        set_status("Failed to connect to partners.")
+        return False  # Command sending failed
+    set_status("Connected successfully." if result.ok else result.summary())
+    return True
+
+def recorded(command, local_action, params=None):
+    """Wrap a local player action so its effect is journaled when it runs."""
+    def run():
+        local_action()
+        session.record(command, params)
+    return run
+
+def send_synced_command(command, local_action, params=None, require_loaded=False):
+    """Have the partners and the local player execute a command at the same instant.
+
+    With clock estimates the command is scheduled on every side at a shared
+    timestamp far enough ahead to cover transit; without one it falls back to
+    executing locally once the partners have acked. Seeks carry our play
+    state so late arrivals can be compensated, and scheduled seeks are
+    followed by a position check.
+    """
+    if drift_corrector:
+        drift_corrector.lead()  # We issued the command, so we lead
+    target = preroll_target(command, params) if partner_urls else None
+    if target is not None:
+        if not ready_barrier(target, require_loaded):
+            return False
+        command, local_action, params = "play", player.play, None  # Everyone waits, warm, at the target
+    lead = get_peer_set().lead_time() if partner_urls else None
+    fingerprint = local_fingerprint if require_loaded else None
+    fields = {}
+    if command == "seek":
+        fields["playing"] = bool(player and player.is_playing())
+    if lead is None:
+        start = clock_now()
+        if not send_command(command, params, require_loaded=require_loaded, fingerprint=fingerprint, **fields):
+            return False
+        if fields.get("playing"):
+            # Partners seeked on arrival, about half a round trip ago, and have played on since
+            target = int(params) + int((clock_now() - start) / 2 * 1000 * player.get_rate())
+            local_action = lambda: player.set_time(target)
+            params = target
+        recorded(command, local_action, params)()
+        return True
+    local_at = clock_now() + lead
+    if send_command(command, params, local_at=local_at, require_loaded=require_loaded, fingerprint=fingerprint, **fields):
+        scheduler.call_at(local_at, recorded(command, local_action, params))
+        if command == "seek":
+            Thread(target=confirm_seek, args=(local_at,), daemon=True).start()
+        return True
+    return False
+
+def preroll_target(command, params):
+    """Where a command should warm up every player before starting, or None to send it as is.
+
+    That is a play from a cold player (not yet started, stopped or ended)
+    and a long seek during playback, both of which leave the decoder to
+    open or refill before it shows anything.
+    """
+    if not player or not preroll or not file_loaded:
+        return None
+    import vlc
+    if command == "play" and player.get_state() not in (vlc.State.Playing, vlc.State.Paused):
+        return 0 if player.get_state() in (vlc.State.Stopped, vlc.State.Ended) else max(player.get_time(), 0)
+    if command == "seek" and player.is_playing() and abs(int(params) - player.get_time()) > PREROLL_SEEK:
+        return int(params)
+    return None
+
+def ready_barrier(target, require_loaded=False):
+    """Have every player prepare at `target` and wait until all of them report ready.
+
+    The local player warms up alongside the partners once one of them has
+    acked the prepare, so a prepare nobody accepts leaves it untouched.
+    Partners that acked are polled for their ready state and buffer level
+    until the deadline; ones still not ready then are reported as
+    stragglers and the start goes ahead without waiting further. True if
+    any partner prepared.
+    """
+    start = clock_now()
+    set_status("Preparing playback...")
+    peers = get_peer_set()
+    result = peers.fanout(
+        "prepare", target, origin=node_id, require_loaded=require_loaded, seq=next(command_seq),
+        fingerprint=local_fingerprint if require_loaded else None,
+    )
+    if not result.acked:
+        set_status("Partners have not loaded the same file." if result.rejected else "Failed to connect to partners.")
+        return False
+    preroll.begin(target)  # Local only if successful on partner
+    session.record("sync", (target, False, player.get_rate()))
+    waiting = {peer for peer in peers if peer.url in result.acked}
+    buffers = {}
+    end = start + PREROLL_DEADLINE
+    while (waiting or not preroll.ready) and clock_now() < end:
+        for peer in list(waiting):
+            reply = peer.request("ready", timeout=max(0.1, min(1.0, end - clock_now())))
+            if reply and reply.get("ready") and reply.get("target") == target:
+                buffers[peer.url] = reply.get("buffer")
+                waiting.discard(peer)
+        if waiting or not preroll.ready:
+            time.sleep(PREROLL_POLL)
+    elapsed = clock_now() - start
+    preroll_seconds.observe(elapsed)
+    if waiting:
+        preroll_stragglers.inc(len(waiting))
+        levels = ", ".join(f"{url} {level:.0f}%" for url, level in buffers.items() if level is not None)
+        print(f"Not ready after {elapsed:.1f} s: {', '.join(peer.url for peer in waiting)}. Ready buffers: {levels or 'n/a'}")
+    return True
+
+def confirm_seek(local_at):
+    """After a seek, compare each partner's position with ours and re-seek any that landed off.
+
+    Positions are compared at the partner's sampling instant, so transit
+    time does not count as error.
+    """
+    time.sleep(max(0.0, local_at + SEEK_SETTLE - clock_now()))
+    for peer in get_peer_set():
+        if not peer.clock.synced:
+            continue
+        reply = peer.channel_request("position", None, timeout=1)
+        if not reply or reply.get("pos") is None:
+            continue
+        playing = bool(player.is_playing())
+        speed = player.get_rate() if playing else 0.0  # ms of media per ms of clock
+        ours = player.get_time() - (clock_now() - peer.clock.to_local(reply["ts"])) * 1000 * speed
+        error = (reply["pos"] - ours) / 1000
+        seek_errors.observe(abs(error))
+        if abs(error) <= SEEK_TOLERANCE:
+            continue
+        at = clock_now() + peer.clock.lead_time()
+        target = int(player.get_time() + (at - clock_now()) * 1000 * speed)
+        print(f"Seek landed {error * 1000:+.0f} ms off on {peer.url}; correcting.")
+        peer.request("seek", target, timeout=1, at=peer.clock.to_remote(at), origin=node_id,
+                     seq=next(command_seq), playing=playing)
+
+def catch_up_with_partners():
+    """Join a partner's playback in one round-trip; True if its state was applied.
+
+    A partner we caught up with before sends only the journal entries we
+    have not seen; otherwise its checkpoint and the entries after it.
+    """
+    for peer in peer_set or []:  # As last synced; get_peer_set can block on peer_lock and DNS
+        known = partner_sessions.get(peer.node) if peer.node else None
+        start = clock_now()
+        reply = peer.request("catch_up", known["v"] if known else None, timeout=2)
+        if not reply or reply.get("status") != "success":
+            continue
+        received = clock_now()
+        transit = (received - start) / 2
+        state = Session.fold(reply["snapshot"] or known, reply["journal"])
+        if not state or not state["v"]:
+            continue
+        partner_sessions[reply.get("node", peer.node)] = state
+        if state["fingerprint"] != local_fingerprint or not player:
+            continue
+        # Where the partner is now: its state at reply time plus the reply's transit
+        pos = Session.position_at(state, reply["now"] + (transit if state["playing"] else 0))
+        # libvlc drops a set_time before the media is playing, so the preroller starts
+        # it, waits for Playing, and leaves it paused on a decoded frame at pos
+        preroll.prepare(int(pos))
+        if state["playing"]:
+            pos = Session.position_at(state, reply["now"] + transit + clock_now() - received)
+            player.set_time(int(pos))
+            player.play()
+            if drift_corrector:
+                drift_corrector.follow(peer.clock, peer.channel_request)
+        session.record("sync", (pos, state["playing"], state["rate"]))
+        return True
+    return False
+
+
+def start_player():
+    """Create the player, behind its actor, and the sync machinery around it."""
+    global player, drift_corrector, command_queue, player_events, preroll
+    import vlc
+    from playeractor import PlayerActor
+    from playerevents import PlayerEvents
+    from preroll import Preroller
+
+    command_queue = CommandQueue(run_checked)
+    instance = vlc.Instance("--quiet")
+    player = PlayerActor(instance.media_player_new())  # The only thread that calls libvlc
+    session.position = player.get_time
+    drift_corrector = DriftCorrector(player).start()
+    player_events = PlayerEvents(player)
+    player_events.add_listener(player.on_player_event)  # First, so other listeners read fresh state
+    player_events.add_listener(drift_corrector.on_player_event)
+    preroll = Preroller(player)
+    player_events.add_listener(preroll.on_player_event)
+    player_events.bind_batches(lambda batch: notify("progress", **batch))
+    metrics.gauge("streamer_drift_seconds", lambda: drift_corrector.drift, "Last measured drift from the leader")
+    metrics.gauge("streamer_playback_rate", lambda: drift_corrector.rate, "Current playback rate")
+    metrics.gauge("streamer_command_queue_depth", lambda: command_queue.depth, "Commands waiting to be sent")
+    metrics.gauge("streamer_commands_merged", lambda: command_queue.merged, "Commands coalesced away")
+
+def set_partners(text):
+    """Use the partner URLs entered in a frontend and open their control channels."""
+    global partner_text, partner_urls
+    partner_text = text
+    partner_urls = parse_peer_urls(text)
+    if partner_urls:
+        Thread(target=get_peer_set, daemon=True).start()
+
+def adopt_lan_partner(url):
+    """Use a partner found on the LAN if none has been entered yet."""
+    if partner_text.strip():
+        return  # Configured partners switch to UDP by themselves once their node ids match
+    set_partners(url)
+    notify("partners", text=url)
+    set_status(f"Found partner on the LAN at {url}")
+
+def load_media(path):
+    """Open a local file and announce it to partners."""
+    global media_name, stream_cache
+    stream_cache = None
+    media_name = path
+    player.set_media(player.get_instance().media_new(path))
+    workers.submit(announce_file, path)
+
+def announce_file(path, fingerprint=None):
+    """Worker: fingerprint the loaded file, then notify partners and check their status."""
+    if fingerprint is None:
+        set_status("Fingerprinting file...")
+        fingerprint = fingerprinter.submit(path).result()  # Cached after the first load
+    load_file_status(fingerprint, path)  # Mark file as loaded locally
+    if not send_command("load_file", fingerprint=fingerprint):
+        notice("warning", "Failed to notify partner about file load.")
+    elif catch_up_with_partners():
+        set_status("Joined the partner's playback.")
+
+    # Partner status arrives with the acks
+    if mismatched_partners():
+        notice("warning", "Partner device loaded a different file.")
+    elif not check_partner_file_status():
+        notice("warning", "Partner device has not loaded the file yet.")
+    else:
+        notice("info", f"File loaded: {path or 'streaming from partner'}")
+
+def check_partner_file_status():
+    """Check the partners' load state as last acked or pushed; no network round-trip."""
+    if not partner_urls:
+        set_status("Partner URL not set.")
+        return False
+    peers = get_peer_set()
+    return all(peer.file_loaded is not False for peer in peers) and not mismatched_partners()
+
+def mismatched_partners():
+    """Partners whose last known fingerprint differs from ours."""
+    return [
+        peer.url for peer in get_peer_set()
+        if peer.fingerprint and local_fingerprint and peer.fingerprint != local_fingerprint
+    ]
+
+def run_checked(command, local_action, params=None):
+    """Command queue worker: send a command that partners reject unless they loaded the same file."""
+    if mismatched_partners():
+        notice("warning", "Partners loaded a different file.")
+        return False
+    if not check_partner_file_status():
+        notice("warning", "File not loaded on both devices.")
+        return False
+    if not send_synced_command(command, local_action, params, require_loaded=True):
+        if not check_partner_file_status():
+            notice("warning", "File not loaded on both devices.")
+        return False
+    return True
+
+def seek(ms):
+    """Queue a synced seek, snapped to a keyframe; returns the target used."""
+    ms = snap_to_keyframe(ms)
+    prefetch_keyframe(ms)
+    command_queue.put("seek", lambda: player.set_time(ms), ms)  # Seek on local only if successful on partner
+    return ms
+
+def http_sources():
+    return [url for url in partner_urls if url.startswith("http")]
+
+def download_from_partner(dest):
+    """Copy the partner's loaded file to `dest`, then play it; rerun with the same target to resume."""
+    sources = http_sources()
+    loaded = [peer.url for peer in get_peer_set() if peer.file_loaded and peer.url in sources]
+    downloader = Downloader(
+        (loaded or sources)[0], dest, progress=lambda done, total: notify("transfer", done=done, total=total),
+    )
+    set_status("Downloading from partner...")
+    try:
+        path = downloader.run()
+    except Exception as e:
+        notice("error", f"Download failed: {e}")
+        return
+    load_media(path)
+
+def stream_from_partner():
+    """Start playing the partner's file while it is fetched into the local cache."""
+    global stream_cache, media_name
+    set_status("Preparing stream from partner...")
+    try:
+        cache = StreamCache.for_partner(http_sources()[0])
+    except Exception as e:
+        notice("error", f"Streaming failed: {e}")
+        return
+    stream_cache = cache
+    media_name = None
+    player.set_media(player.get_instance().media_new("http://127.0.0.1:5000/stream"))
+    # The partner's fingerprint is ours too, since the bytes are verified against its manifest
+    workers.submit(announce_file, None, cache.manifest["fingerprint"])
+    workers.submit(cache.load_keyframes)
+
+def stats_text():
+    """Live latency, retry and sync figures, as shown in the frontends' stats panel."""
+    lines = ["Command RTT (ms)          p50     p95     p99       n"]
+    for labels, histogram in metrics.REGISTRY.collect("streamer_command_rtt_seconds"):
+        p50, p95, p99 = (histogram.quantile(q) * 1000 for q in (0.5, 0.95, 0.99)) if histogram.count else (0, 0, 0)
+        name = f"{labels['command']} ({labels['transport']})"
+        lines.append(f"{name:<22} {p50:7.1f} {p95:7.1f} {p99:7.1f} {histogram.count:7d}")
+    for name, title in (("streamer_command_retries_total", "Retries"), ("streamer_command_timeouts_total", "Timeouts")):
+        total = sum(counter.value for _, counter in metrics.REGISTRY.collect(name))
+        lines.append(f"{title}: {total}")
+    for peer in peer_set or []:  # As last synced; get_peer_set can block on peer_lock and DNS
+        if peer.breaker.open:
+            lines.append(f"Circuit open: {peer.url}")
+        elif peer.clock.synced:
+            lines.append(f"Offset {peer.url}: {peer.clock.offset * 1000:+.1f} ms (RTT {peer.clock.rtt * 1000:.1f} ms)")
+    drift = drift_corrector.drift if drift_corrector else None
+    lines.append(f"Drift: {drift * 1000:+.1f} ms, rate {drift_corrector.rate:.3f}" if drift is not None else "Drift: n/a")
+    if command_queue:
+        lines.append(f"Command queue depth: {command_queue.depth} ({command_queue.merged} merged)")
+    if lan_endpoint:
+        lines.append(f"LAN partners: {len(lan_endpoint.partners())}")
+    return "\n".join(lines)
+
+def engine_state():
+    """Everything a frontend shows, for one that has just connected."""
+    return {
+        "status": "success",
+        "text": status_text,
+        "partners": partner_text,
+        "media": media_name,
+        "streaming": stream_cache is not None,
+        "file_loaded": file_loaded,
+        "time": player.get_time() if player else -1,
+        "length": player.get_length() if player else -1,
+        "playing": bool(player and player.is_playing()),
+        "warm": warm.is_set(),
+        "error": warm_up_error,
+        "startup": startup.report(),
+    }
+
+def handle_ipc(action, params=None, **fields):
+    """Frontend request handler. Runs on the IPC event loop, so anything slow goes to a worker."""
+    if action == "state":
+        return engine_state()
+    if action == "stats":
+        return {"status": "success", "text": stats_text()}
+    if action == "partners":
+        set_partners(params or "")
+        return {"status": "success", "action": action}
+    if action == "shutdown":
+        workers.submit(shutdown)
+        return {"status": "success", "action": action}
+    if action == "load" and (not params or not os.path.exists(params)):
+        return {"status": "error", "message": "File does not exist. Please try again."}
+    if action in ("download", "stream") and not http_sources():
+        return {"status": "error", "message": f"Set an http(s) partner URL to {action} from."}
+    if not warm.is_set():
+        # Frontends connect before the player exists; hold the request until it does
+        workers.submit(after_warm_up, action, params)
+        return {"status": "success", "action": action, "pending": True}
+    if warm_up_error:
+        return {"status": "error", "message": warm_up_error}
+    if action == "load":
+        load_media(params)
+    elif action == "play":
+        command_queue.put("play", player.play)  # Play on local only if successful on partner
+    elif action == "pause":
+        command_queue.put("pause", player.pause)
+    elif action == "stop":
+        command_queue.put("stop", player.stop)
+    elif action == "seek":
+        return {"status": "success", "action": "seek", "time": seek(int(params))}
+    elif action == "download":
+        workers.submit(download_from_partner, params)
+    elif action == "stream":
+        workers.submit(stream_from_partner)
+    else:
+        return {"status": "error", "message": f"Unknown request: {action}"}
+    return {"status": "success", "action": action}
+
+def after_warm_up(action, params):
+    """Worker: run a request that arrived during warm-up once the player is there."""
+    warm.wait()
+    reply = handle_ipc(action, params)
+    if reply["status"] == "error":
+        notice("error", reply["message"])
+
+def warm_up():
+    """Create the player and start the servers, after frontends can already connect.
+
+    libvlc scans its plugins on the first instance and Flask, waitress
+    and requests are slow to import, so none of it sits between launch
+    and a responsive window.
+    """
+    global warm_up_error
+    ipc_server.listening.wait()
+    startup.mark("ipc")
+    try:
+        start_player()
+        startup.mark("player")
+    except Exception as e:  # No libvlc, or a broken VLC install
+        warm_up_error = f"Player unavailable: {e}"
+    Thread(target=start_server, daemon=True).start()
+    Thread(target=start_control_server, daemon=True).start()
+    start_lan(on_discover=lambda node, url: adopt_lan_partner(url))
+    startup.mark("warm")
+    warm.set()
+    if warm_up_error:
+        set_status(warm_up_error)
+        notice("error", warm_up_error)
+    else:
+        set_status("Ready.")
+
+def shutdown():
+    """Stop playback and the engine; connected frontends see their connection close."""
+    try:
+        if player:
+            player.stop().result(timeout=5)  # Let the actor stop VLC before we exit
+    finally:
+        ipc_server.close()
+
+def serve_ipc():
+    """Serve frontends until shutdown, warming up meanwhile; False if another engine is already running."""
+    global ipc_server
+    address = engine_address()
+    if connect_engine(address):
+        return False
+    if isinstance(address, str):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        if os.path.exists(address):
+            os.remove(address)  # Left behind by an engine that did not exit cleanly
+        ipc_server = AsyncControlServer(handle_ipc, path=address)
+    else:
+        ipc_server = AsyncControlServer(handle_ipc, host=address[0], port=address[1])
+    Thread(target=warm_up, daemon=True).start()
+    try:
+        ipc_server.serve_forever()
+    finally:
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamer engine: player, partner networking and sync, without a UI.")
+    parser.add_argument("--stop", action="store_true", help="shut down the running engine")
+    args = parser.parse_args([arg for arg in sys.argv[1:] if arg != "--engine"])  # --engine: bundled app
+    if args.stop:
+        try:
+            EngineClient().connect(spawn=False).call("shutdown")
+        except ConnectionError:
+            print("No engine is running.")
+        return
+    startup.mark("imports")
+    if not serve_ipc():
+        print("An engine is already running.")
+
+if __name__ == "__main__":
+    main()
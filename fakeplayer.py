@@ -0,0 +1,143 @@
+import random
+import threading
+
+import vlc
+
+from clocksync import clock_now
+
+BUFFERED_MS = 5000  # A jump further than this while playing refills the decoder
+
+
+class SimulatedPlayer:
+    """Clock-driven stand-in for vlc.MediaPlayer, for headless runs and benchmarks.
+
+    Position advances with the local clock at the playback rate. `skew`
+    makes this player's clock run slightly fast or slow, as real sound
+    cards do, and `start_delay` is the worst-case decoder spin-up time
+    after a cold play() or a long jump during playback. Once playing, or
+    paused after playing, the decoder is warm and play() starts at once.
+    Listeners get "playing", "paused" and "stopped" as the state changes
+    and "buffering" at 100 when playback resumes, as from PlayerEvents.
+    """
+
+    def __init__(self, length_ms=2 * 60 * 60 * 1000, skew=0.0, start_delay=0.0):
+        self.length = length_ms
+        self.skew = skew
+        self.start_delay = start_delay
+        self.rate = 1.0
+        self.playing = False
+        self.warm = False
+        self.muted = False
+        self.listeners = []
+        self._base = 0.0  # Position in ms at _since
+        self._since = clock_now()
+        self._lock = threading.Lock()
+
+    def _position(self, now):
+        if not self.playing or now < self._since:
+            return self._base
+        return self._base + (now - self._since) * 1000 * self.rate * (1 + self.skew)
+
+    def _rebase(self, now):
+        self._base = min(self._position(now), self.length)
+        self._since = now
+
+    def add_listener(self, listener):
+        """listener(name, value), called from a timer thread."""
+        self.listeners.append(listener)
+
+    def _spin_up(self, now):
+        """Resume after a random decoder start delay, reporting the buffer full then."""
+        self._since = now + random.uniform(0, self.start_delay)
+        self._buffered_at(self._since)
+
+    def _buffered_at(self, when):
+        self._emit("buffering", 100.0, when)
+
+    def _emit(self, name, value=True, when=None):
+        delay = 0.0 if when is None else max(0.0, when - clock_now())
+        for listener in self.listeners:
+            threading.Timer(delay, listener, (name, value)).start()
+
+    def position_at(self, ts):
+        """Position in ms at local clock time `ts`, for measuring sync error."""
+        with self._lock:
+            return self._position(ts)
+
+    def get_time(self):
+        with self._lock:
+            return int(self._position(clock_now()))
+
+    def get_length(self):
+        return self.length
+
+    def set_time(self, ms):
+        with self._lock:
+            now = clock_now()
+            cold = self.playing and abs(ms - self._position(now)) > BUFFERED_MS
+            self._base = float(ms)
+            if cold:
+                self._spin_up(now)
+            elif self.playing:
+                self._since = max(now, self._since)  # Still spinning up from play()
+                self._buffered_at(self._since)
+            else:
+                self._since = now
+
+    def play(self):
+        with self._lock:
+            now = clock_now()
+            self._rebase(now)
+            if not self.playing:
+                self.playing = True
+                self._emit("playing")
+                if self.warm:
+                    self._buffered_at(now)
+                else:
+                    self._spin_up(now)
+                self.warm = True
+
+    def pause(self):
+        with self._lock:
+            now = clock_now()
+            self._rebase(now)
+            self.playing = not self.playing  # VLC's pause() toggles
+            self._emit("playing" if self.playing else "paused")
+
+    def set_pause(self, do_pause):
+        with self._lock:
+            now = clock_now()
+            self._rebase(now)
+            if self.playing == bool(do_pause):
+                self._emit("paused" if do_pause else "playing")
+            self.playing = not do_pause
+
+    def stop(self):
+        with self._lock:
+            self.playing = False
+            self.warm = False
+            self._base = 0.0
+            self._emit("stopped")
+
+    def get_state(self):
+        if self.playing:
+            return vlc.State.Playing
+        return vlc.State.Paused if self.warm else vlc.State.Stopped
+
+    def audio_get_mute(self):
+        return int(self.muted)
+
+    def audio_set_mute(self, muted):
+        self.muted = bool(muted)
+
+    def is_playing(self):
+        return int(self.playing)
+
+    def get_rate(self):
+        return self.rate
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._rebase(clock_now())
+            self.rate = rate
+        return 0
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+SAMPLE_SIZE = 64 * 1024
+SAMPLES = 64  # Evenly spaced samples, always including the head and tail
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".streamer")
+CACHE_PATH = os.path.join(CACHE_DIR, "fingerprints.json")
+
+
+def compute_fingerprint(path):
+    """Hash the file size plus evenly spaced samples of its content.
+
+    Different cuts or encodes of a film differ in size or in the sampled
+    bytes, and a multi-GB file costs only SAMPLES small reads. Files
+    smaller than the sampled span are hashed in full.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as f:
+        if size <= SAMPLES * SAMPLE_SIZE:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        else:
+            step = (size - SAMPLE_SIZE) // (SAMPLES - 1)
+            for i in range(SAMPLES):
+                f.seek(i * step)
+                digest.update(f.read(SAMPLE_SIZE))
+    return f"{size:x}-{digest.hexdigest()}"
+
+
+class FingerprintCache:
+    """Fingerprints persisted on disk, keyed by path, size and mtime."""
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    @staticmethod
+    def key(path):
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+    def get(self, path):
+        return self._entries.get(self.key(path))
+
+    def put(self, path, fingerprint):
+        with self._lock:
+            self._entries[self.key(path)] = fingerprint
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print(f"Failed to save fingerprint cache: {e}")
+
+
+class Fingerprinter:
+    """Compute fingerprints on a background worker, reusing cached ones."""
+
+    def __init__(self, cache=None):
+        self.cache = cache or FingerprintCache()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fingerprint")
+
+    def submit(self, path):
+        """Return a Future for the fingerprint of `path`."""
+        return self._pool.submit(self.fingerprint, path)
+
+    def fingerprint(self, path):
+        cached = self.cache.get(path)
+        if cached:
+            return cached
+        fingerprint = compute_fingerprint(path)
+        self.cache.put(path, fingerprint)
+        return fingerprint
@@ -16,19 +16,19 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
+# One-folder bundle: the one-file build unpacked itself to a temp directory on
+# every launch before any Python ran. UPX is off because compressed libraries
+# are decompressed again at every load.
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='gui',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -36,3 +36,12 @@ exe = EXE(
     codesign_identity=None,
     entitlements_file=None,
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='gui',
+)
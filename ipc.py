@@ -0,0 +1,104 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from control import Connection
+from fingerprint import CACHE_DIR
+
+ENGINE_SOCKET = os.path.join(CACHE_DIR, "engine.sock")
+ENGINE_PORT = 5004  # Loopback TCP where Unix sockets are unavailable (Windows)
+ENGINE_LOG = os.path.join(CACHE_DIR, "engine.log")
+ENGINE_START_TIMEOUT = 15.0
+
+
+def engine_address():
+    """Where the engine listens for frontends: a socket path, or a loopback (host, port)."""
+    if os.name == "nt" or not hasattr(socket, "AF_UNIX"):
+        return ("127.0.0.1", ENGINE_PORT)
+    return ENGINE_SOCKET
+
+
+def connect_engine(address=None, timeout=1.0):
+    """Open a socket to a running engine; None if nothing is listening."""
+    address = address or engine_address()
+    try:
+        if isinstance(address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(address)
+        else:
+            sock = socket.create_connection(address, timeout=timeout)
+    except OSError:
+        return None
+    sock.settimeout(None)
+    return sock
+
+
+def engine_command():
+    """Command line that starts the engine, from source or from the bundled executable."""
+    if getattr(sys, "frozen", False):
+        return [sys.executable, "--engine"]
+    return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "engine.py")]
+
+
+def spawn_engine():
+    """Start the engine in the background, detached from this frontend's lifetime."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    log = open(ENGINE_LOG, "ab")
+    options = {}
+    if os.name == "nt":
+        options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options["start_new_session"] = True
+    subprocess.Popen(engine_command(), stdin=subprocess.DEVNULL, stdout=log, stderr=log, **options)
+    log.close()
+
+
+class EngineClient:
+    """A frontend's connection to the engine, which it starts if none is running.
+
+    Requests go out as control-channel commands and their replies come
+    back as acks; the engine's events (status, progress, notices) arrive
+    as state messages and are handed to `on_event`, on the reader thread.
+    A {"kind": "closed"} event follows when the engine goes away.
+    """
+
+    def __init__(self, on_event=None):
+        self.on_event = on_event
+        self.conn = None
+
+    def connect(self, spawn=True, timeout=ENGINE_START_TIMEOUT):
+        sock = connect_engine()
+        if sock is None and spawn:
+            spawn_engine()
+            end = time.monotonic() + timeout
+            while sock is None and time.monotonic() < end:
+                time.sleep(0.05)
+                sock = connect_engine()
+        if sock is None:
+            raise ConnectionError("The engine is not running")
+        self.conn = Connection(sock, on_state=self._on_state)
+        threading.Thread(target=self._serve, daemon=True).start()
+        return self
+
+    def _serve(self):
+        self.conn.serve()
+        self._on_state({"kind": "closed"})
+
+    def _on_state(self, event):
+        if self.on_event and event:
+            self.on_event(event)
+
+    def call(self, action, params=None, timeout=5, **fields):
+        """Send a request to the engine and return its reply."""
+        reply = self.conn.request(action, params, timeout, **fields) if self.conn else None
+        if reply is None:
+            raise ConnectionError(f"The engine did not answer {action}")
+        return reply
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
@@ -0,0 +1,417 @@
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+from fingerprint import CACHE_DIR
+
+KEYFRAME_DIR = os.path.join(CACHE_DIR, "keyframes")
+SNAP_WINDOW = 2000  # ms; a seek this close after a keyframe lands on the keyframe
+_MAGIC = b"SKF1"
+
+
+class KeyframeIndex:
+    """Keyframe presentation times (ms) and byte offsets, in two parallel arrays.
+
+    Times are sorted, so lookups are a bisect. An offset of -1 means the
+    container gave the time but not the position.
+    """
+
+    def __init__(self, times, offsets):
+        self.times = array("q", times)
+        self.offsets = array("q", offsets)
+
+    def __len__(self):
+        return len(self.times)
+
+    def _at_or_before(self, ms):
+        i = bisect_right(self.times, ms) - 1
+        return i if i >= 0 else None
+
+    def snap(self, ms, window=SNAP_WINDOW):
+        """The keyframe at or before `ms` if it is within `window`, else `ms` itself."""
+        i = self._at_or_before(ms)
+        if i is None or ms - self.times[i] > window:
+            return ms
+        return self.times[i]
+
+    def offsets_from(self, ms, count=2):
+        """Byte offsets of the keyframe a seek to `ms` decodes from and the ones after it."""
+        i = self._at_or_before(ms) or 0
+        return [offset for offset in self.offsets[i:i + count] if offset >= 0]
+
+    def to_bytes(self):
+        return _MAGIC + struct.pack("<I", len(self)) + _little(self.times).tobytes() + _little(self.offsets).tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != _MAGIC:
+            raise ValueError("Not a keyframe index")
+        (count,) = struct.unpack_from("<I", data, 4)
+        times, offsets = array("q"), array("q")
+        times.frombytes(data[8:8 + 8 * count])
+        offsets.frombytes(data[8 + 8 * count:8 + 16 * count])
+        return cls(_little(times), _little(offsets))
+
+    def to_json(self):
+        return {"times": self.times.tolist(), "offsets": self.offsets.tolist()}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["times"], data["offsets"])
+
+
+def _little(values):
+    """Byte-swap an array to or from little-endian storage order."""
+    if sys.byteorder == "little":
+        return values
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped
+
+
+def _table(data, typecode):
+    """Decode a run of big-endian integers, as MP4 sample tables store them."""
+    values = array(typecode)
+    values.frombytes(data[:len(data) - len(data) % values.itemsize])
+    if sys.byteorder == "little":
+        values.byteswap()
+    return values
+
+
+# MP4 / ISO BMFF
+
+def _boxes(f, start, end):
+    """Yield (type, payload start, payload end) for the boxes in [start, end)."""
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(16)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack_from(">I4s", header)
+        payload = pos + 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", header, 8)
+            payload = pos + 16
+        elif size == 0:
+            size = end - pos  # Box runs to the end of its parent
+        if size < 8:
+            return
+        yield kind, payload, pos + size
+        pos += size
+
+
+def _child(f, start, end, *path):
+    """Payload bounds of the first box along a path of box types, or None."""
+    for kind in path:
+        for found, payload, box_end in _boxes(f, start, end):
+            if found == kind:
+                start, end = payload, box_end
+                break
+        else:
+            return None
+    return start, end
+
+
+def _read(f, bounds):
+    f.seek(bounds[0])
+    return f.read(bounds[1] - bounds[0])
+
+
+def _full_box_table(f, bounds, typecode, header=8):
+    """Entries of a 'full box' table: version/flags and entry count, then the entries."""
+    if bounds is None:
+        return None
+    return _table(_read(f, bounds)[header:], typecode)
+
+
+def _mp4_track(f, start, end):
+    """Index one video trak; None for other tracks."""
+    hdlr = _child(f, start, end, b"mdia", b"hdlr")
+    if hdlr is None or _read(f, hdlr)[8:12] != b"vide":
+        return None
+    mdhd = _child(f, start, end, b"mdia", b"mdhd")
+    if mdhd is None:
+        return None
+    mdhd = _read(f, mdhd)
+    timescale = struct.unpack_from(">I", mdhd, 20 if mdhd[0] == 1 else 12)[0]
+    stbl = _child(f, start, end, b"mdia", b"minf", b"stbl")
+    if stbl is None or not timescale:
+        return None
+
+    def table(kind, typecode, header=8):
+        return _full_box_table(f, _child(f, *stbl, kind), typecode, header)
+
+    stts = table(b"stts", "I")  # (sample count, delta) runs
+    stss = table(b"stss", "I")  # 1-based sync sample numbers; absent if every sample is one
+    ctts = table(b"ctts", "i")  # (sample count, composition offset) runs
+    stsc = table(b"stsc", "I")  # (first chunk, samples per chunk, description) runs
+    stsz_box = _child(f, *stbl, b"stsz")
+    stco = table(b"stco", "I")
+    if stco is None:
+        stco = table(b"co64", "Q")
+    if stts is None:
+        return None
+
+    # Decode time and composition offset of every sample, walking the runs
+    stts = stts[:len(stts) // 2 * 2]
+    sample_count = sum(stts[0::2])
+    if stss is None:
+        sync = range(1, sample_count + 1)
+    else:
+        sync = sorted({number for number in stss if 1 <= number <= sample_count})  # Drop entries stts never reaches
+    ctts = ctts[:len(ctts) // 2 * 2] if ctts else None
+    times = []
+    run, left, dts = 0, stts[0] if stts else 0, 0
+    c_run, c_left = 0, ctts[0] if ctts else 0
+    while ctts and not c_left and c_run * 2 + 2 < len(ctts):
+        c_run += 1
+        c_left = ctts[c_run * 2]
+    sample = 1
+    for target in sync:
+        while sample < target:
+            while not left and run * 2 + 2 < len(stts):
+                run += 1
+                left = stts[run * 2]
+            if not left:
+                break  # The stts runs are exhausted
+            step = min(target - sample, left)
+            dts += step * stts[run * 2 + 1]
+            left -= step
+            sample += step
+            c_step = step if ctts else 0
+            while c_step and c_left:  # Samples past the ctts runs keep the last offset
+                taken = min(c_step, c_left)
+                c_left -= taken
+                c_step -= taken
+                while not c_left and c_run * 2 + 2 < len(ctts):
+                    c_run += 1
+                    c_left = ctts[c_run * 2]
+        if sample != target:
+            break
+        offset = ctts[c_run * 2 + 1] if ctts else 0
+        times.append((dts + offset) * 1000 // timescale)
+
+    offsets = [-1] * len(times)
+    if stsc is not None and stco is not None and stsz_box is not None:
+        stsz = _read(f, stsz_box)
+        uniform, count = struct.unpack_from(">II", stsz, 4)
+        sizes = None if uniform else _table(stsz[12:], "I")
+        last = min(sample_count, count if uniform else len(sizes))
+        wanted = {number: i for i, number in enumerate(sync[:len(times)])}
+        for sample, position in _sample_positions(stsc, stco, sizes, uniform, last):
+            i = wanted.get(sample)
+            if i is not None:
+                offsets[i] = position
+    return times, offsets
+
+
+def _sample_positions(stsc, stco, sizes, uniform, last):
+    """Yield (sample number, byte offset) for samples 1 to `last`, walking the chunk runs."""
+    sample = 1
+    runs = [(stsc[i], stsc[i + 1]) for i in range(0, len(stsc) - 2, 3)]
+    for r, (first_chunk, per_chunk) in enumerate(runs):
+        last_chunk = runs[r + 1][0] - 1 if r + 1 < len(runs) else len(stco)
+        for chunk in range(max(first_chunk, 1), min(last_chunk, len(stco)) + 1):
+            position = stco[chunk - 1]
+            for _ in range(per_chunk):
+                if sample > last:
+                    return
+                yield sample, position
+                position += uniform or sizes[sample - 1]
+                sample += 1
+
+
+def index_mp4(f, size):
+    moov = _child(f, 0, size, b"moov")
+    if moov is None:
+        return None
+    for kind, start, end in _boxes(f, *moov):
+        if kind == b"trak":
+            track = _mp4_track(f, start, end)
+            if track:
+                times, offsets = track
+                order = sorted(range(len(times)), key=times.__getitem__)  # Composition order
+                return KeyframeIndex([times[i] for i in order], [offsets[i] for i in order])
+    return None
+
+
+# Matroska / WebM
+
+EBML, SEGMENT, SEEK_HEAD, INFO, TRACKS, CUES, CLUSTER = (
+    0x1A45DFA3, 0x18538067, 0x114D9B74, 0x1549A966, 0x1654AE6B, 0x1C53BB6B, 0x1F43B675,
+)
+_UNKNOWN = -1
+
+
+def _vint(f, keep_marker):
+    first = f.read(1)
+    if not first:
+        raise EOFError
+    byte = first[0]
+    length = 1
+    while length <= 8 and not byte & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable-length integer")
+    value = byte if keep_marker else byte & (0xFF >> length)
+    rest = f.read(length - 1)
+    for b in rest:
+        value = (value << 8) | b
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return _UNKNOWN, length
+    return value, length
+
+
+def _elements(f, start, end):
+    """Yield (id, data start, data size) for the EBML elements in [start, end)."""
+    pos = start
+    while pos < end:
+        f.seek(pos)
+        try:
+            element, id_len = _vint(f, True)
+            size, size_len = _vint(f, False)
+        except (EOFError, ValueError):
+            return
+        data = pos + id_len + size_len
+        yield element, data, size
+        if size == _UNKNOWN:
+            return  # Live-style stream: no way to skip past this element
+        pos = data + size
+
+
+def _uint(f, data, size):
+    f.seek(data)
+    return int.from_bytes(f.read(size), "big")
+
+
+def index_mkv(f, size):
+    segment = next(((data, length) for element, data, length in _elements(f, 0, size) if element == SEGMENT), None)
+    if segment is None:
+        return None
+    base = segment[0]
+    end = size if segment[1] == _UNKNOWN else min(size, base + segment[1])
+    found, pointers = {}, {}
+    for element, data, length in _elements(f, base, end):
+        if element in (INFO, TRACKS, CUES):
+            found[element] = (data, length)
+        elif element == SEEK_HEAD:
+            for seek, seek_data, seek_len in _elements(f, data, data + length):
+                fields = {child: (cdata, clen) for child, cdata, clen in _elements(f, seek_data, seek_data + seek_len)}
+                if 0x53AB in fields and 0x53AC in fields:
+                    f.seek(fields[0x53AB][0])
+                    target = int.from_bytes(f.read(fields[0x53AB][1]), "big")
+                    pointers[target] = base + _uint(f, *fields[0x53AC])
+        elif element == CLUSTER and all(kind in found or kind in pointers for kind in (INFO, TRACKS, CUES)):
+            break  # The rest is media; the SeekHead says where the metadata is
+    for kind, position in pointers.items():
+        if kind in (INFO, TRACKS, CUES) and kind not in found:
+            for element, data, length in _elements(f, position, end):
+                if element == kind:
+                    found[kind] = (data, length)
+                break
+    if CUES not in found:
+        return None
+
+    scale = 1_000_000  # TimecodeScale, ns per tick
+    if INFO in found:
+        data, length = found[INFO]
+        for element, cdata, clen in _elements(f, data, data + length):
+            if element == 0x2AD7B1:
+                scale = _uint(f, cdata, clen)
+    video = None
+    if TRACKS in found:
+        data, length = found[TRACKS]
+        for entry, edata, elen in _elements(f, data, data + length):
+            fields = {child: _uint(f, cdata, clen) for child, cdata, clen in _elements(f, edata, edata + elen)
+                      if child in (0xD7, 0x83)}
+            if fields.get(0x83) == 1:  # TrackType video
+                video = fields.get(0xD7)
+                break
+
+    times, offsets = array("q"), array("q")
+    data, length = found[CUES]
+    for point, pdata, plen in _elements(f, data, data + length):
+        if point != 0xBB:
+            continue
+        cue_time, position = None, None
+        for child, cdata, clen in _elements(f, pdata, pdata + plen):
+            if child == 0xB3:
+                cue_time = _uint(f, cdata, clen)
+            elif child == 0xB7:
+                track, cluster = None, None
+                for item, idata, ilen in _elements(f, cdata, cdata + clen):
+                    if item == 0xF7:
+                        track = _uint(f, idata, ilen)
+                    elif item == 0xF1:
+                        cluster = _uint(f, idata, ilen)
+                if video is None or track == video:
+                    position = base + cluster if cluster is not None else -1
+        if cue_time is not None and position is not None:
+            times.append(cue_time * scale // 1_000_000)
+            offsets.append(position)
+    return KeyframeIndex(times, offsets) if times else None
+
+
+def build_index(path):
+    """Index an MP4/MOV or MKV/WebM file's keyframes; None for other formats."""
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        head = f.read(12)
+        f.seek(0)
+        if head[:4] == EBML.to_bytes(4, "big"):
+            return index_mkv(f, size)
+        if head[4:8] in (b"ftyp", b"moov", b"mdat", b"free", b"wide", b"skip"):
+            return index_mp4(f, size)
+    return None  # E.g. AVI: seeks are left to VLC
+
+
+class KeyframeStore:
+    """Build keyframe indexes in the background and cache them by fingerprint."""
+
+    def __init__(self, directory=KEYFRAME_DIR):
+        self.directory = directory
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="keyframes")
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, fingerprint):
+        """Return the index if ready (None if not yet, or the format has none)."""
+        with self._lock:
+            future = self._futures.get(fingerprint)
+            if future is None:
+                future = self._pool.submit(self._load_or_build, path, fingerprint)
+                self._futures[fingerprint] = future
+        if not future.done():
+            return None
+        return future.result()
+
+    def done(self, fingerprint):
+        """True once indexing finished, to tell "still building" from "no index"."""
+        future = self._futures.get(fingerprint)
+        return future is not None and future.done()
+
+    def _load_or_build(self, path, fingerprint):
+        cache_path = os.path.join(self.directory, f"{fingerprint}.kfi")
+        try:
+            with open(cache_path, "rb") as f:
+                return KeyframeIndex.from_bytes(f.read())
+        except (OSError, ValueError):
+            pass
+        try:
+            index = build_index(path)
+        except (OSError, ValueError, struct.error, IndexError) as e:
+            print(f"Failed to index keyframes: {e}")
+            return None
+        if index is not None:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(cache_path, "wb") as f:
+                    f.write(index.to_bytes())
+            except OSError as e:
+                print(f"Failed to cache keyframe index: {e}")
+        return index
@@ -0,0 +1,251 @@
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import metrics
+from control import _ENVELOPE
+from wire import WIRE_VERSION, decode, encode, is_binary
+
+LAN_PORT = 5002  # UDP, for both discovery beacons and control datagrams
+MULTICAST_GROUP = "239.255.50.2"
+BEACON_INTERVAL = 1.0
+PEER_TIMEOUT = 3.5  # A peer is gone after about three missed beacons
+INITIAL_RTO = 0.03  # First retransmission timeout; doubled on every retry
+MAX_RTO = 0.5
+LAN_TIMEOUT = 1.0  # Give up on a LAN partner this soon and use the slower paths
+MAX_DATAGRAM = 8192
+REPLY_CACHE = 1024  # Acks kept to answer retransmitted commands
+
+
+def _encode(message, version=0):
+    if version:
+        return encode([message])
+    return json.dumps(message, separators=(",", ":")).encode("utf-8")
+
+
+class _Pending:
+    __slots__ = ("data", "address", "event", "reply", "retry_at", "rto")
+
+    def __init__(self, data, address):
+        self.data = data
+        self.address = address
+        self.event = threading.Event()
+        self.reply = None
+        self.rto = INITIAL_RTO
+        self.retry_at = time.monotonic() + self.rto
+
+
+class LanEndpoint:
+    """UDP control endpoint with LAN discovery, for partners on the same network.
+
+    One socket does everything. Beacons announce this node's id by
+    multicast and broadcast, and commands go straight to a discovered
+    partner's address as single datagrams. Every command datagram carries
+    a sequence number and is acked on its own, so only the datagrams that
+    are still unacked get resent, with a backoff that doubles each time.
+    The receiver remembers recent acks by (sender, seq), so a retransmitted
+    command is answered again without being applied twice. Beacons carry
+    the wire format each node reads. Datagrams go to a partner in binary
+    once its beacon offers it, and acks go back in the format of their
+    command.
+    """
+
+    def __init__(self, handler, node, port=LAN_PORT, on_state=None, on_discover=None):
+        self.handler = handler
+        self.node = node
+        self.port = port
+        self.on_state = on_state
+        self.on_discover = on_discover  # on_discover(node, url) for newly seen partners
+        self.sock = None
+        self.seen = {}  # (host, port) -> [node, last heard]
+        self.versions = {}  # (host, port) -> wire version to send in, from its beacons
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._replies = OrderedDict()  # (sender node, seq) -> encoded ack
+        self._cond = threading.Condition()
+        self._stopped = threading.Event()
+        self._retransmits = metrics.counter("streamer_lan_retransmits_total", "Control datagrams sent again")
+
+    def start(self):
+        """Bind and start the threads; raises OSError if the port is taken."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind(("", self.port))
+        try:
+            membership = struct.pack("4s4s", socket.inet_aton(MULTICAST_GROUP), socket.inet_aton("0.0.0.0"))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        except OSError as e:
+            print(f"LAN multicast unavailable, using broadcast only: {e}")
+        self.sock = sock
+        metrics.gauge("streamer_lan_peers", lambda: len(self.partners()), "Partners found on the LAN")
+        for target in (self._receive, self._beacon, self._retransmit):
+            threading.Thread(target=target, daemon=True).start()
+        return self
+
+    def _send(self, data, address):
+        try:
+            self.sock.sendto(data, address)
+        except OSError:
+            pass  # Unreachable now; the retransmit loop or the caller's timeout covers it
+
+    def _beacon(self):
+        hello = _encode({"type": "hello", "node": self.node, "wire": WIRE_VERSION})
+        while not self._stopped.is_set():
+            self._send(hello, (MULTICAST_GROUP, self.port))
+            self._send(hello, ("<broadcast>", self.port))
+            self._stopped.wait(BEACON_INTERVAL)
+
+    def _receive(self):
+        while not self._stopped.is_set():
+            try:
+                data, address = self.sock.recvfrom(MAX_DATAGRAM)
+                messages = decode(data)
+            except OSError:
+                return
+            except ValueError:
+                continue
+            version = WIRE_VERSION if is_binary(data) else 0
+            for message in messages:
+                if not isinstance(message, dict):
+                    continue
+                try:
+                    self._dispatch(message, address, version)
+                except Exception as e:  # A malformed datagram must not stop the receive loop
+                    print(f"Dropped LAN datagram from {address[0]}:{address[1]}: {e!r}")
+
+    def _dispatch(self, message, address, version=0):
+        kind = message.get("type")
+        node = message.get("node") if kind == "hello" else message.get("src")
+        if node == self.node:
+            return  # Our own beacon, looped back
+        if node:
+            self._heard(node, address)
+        if kind == "hello":
+            self.versions[address] = min(message.get("wire", 0), WIRE_VERSION)
+        if kind == "ack":
+            with self._cond:
+                pending = self._pending.pop(message.get("id"), None)
+            if pending:
+                pending.reply = message
+                pending.event.set()
+        elif kind == "cmd":
+            key = (node, message.get("id"))
+            data = self._replies.get(key)
+            if data is None:
+                fields = {k: v for k, v in message.items() if k not in _ENVELOPE and k != "src"}
+                try:
+                    reply = self.handler(message["action"], message.get("params"), **fields)
+                except Exception as e:
+                    reply = {"status": "error", "message": str(e)}
+                data = _encode(dict(reply, type="ack", id=message.get("id"), src=self.node), version)
+                self._replies[key] = data
+                if len(self._replies) > REPLY_CACHE:
+                    self._replies.popitem(last=False)
+            self._send(data, address)
+        elif kind == "state" and self.on_state and isinstance(message.get("state"), dict):
+            self.on_state(message.get("state"))
+
+    def _heard(self, node, address):
+        entry = self.seen.get(address)
+        self.seen[address] = [node, time.monotonic()]
+        if (entry is None or entry[0] != node) and self.on_discover:
+            self.on_discover(node, f"udp://{address[0]}:{address[1]}")
+
+    def _retransmit(self):
+        with self._cond:
+            while not self._stopped.is_set():
+                now = time.monotonic()
+                wake = now + MAX_RTO
+                for pending in self._pending.values():
+                    if pending.retry_at <= now:
+                        self._send(pending.data, pending.address)
+                        self._retransmits.inc()
+                        pending.rto = min(pending.rto * 2, MAX_RTO)
+                        pending.retry_at = now + pending.rto
+                    wake = min(wake, pending.retry_at)
+                self._cond.wait(wake - now)
+
+    def request(self, address, action, params=None, timeout=5, **fields):
+        """Send a command datagram and wait for its ack; None on timeout."""
+        msg_id = next(self._ids)
+        message = {"type": "cmd", "id": msg_id, "src": self.node, "action": action, "params": params}
+        message.update((k, v) for k, v in fields.items() if v is not None)
+        pending = _Pending(_encode(message, self.versions.get(address, 0)), address)
+        with self._cond:
+            self._pending[msg_id] = pending
+            self._cond.notify()
+        self._send(pending.data, address)
+        if pending.event.wait(timeout):
+            return pending.reply
+        with self._cond:
+            self._pending.pop(msg_id, None)
+        return None
+
+    def alive(self, address):
+        entry = self.seen.get(address)
+        return entry is not None and time.monotonic() - entry[1] < PEER_TIMEOUT
+
+    def partners(self):
+        """Node id -> address of every partner heard from recently."""
+        return {node: address for address, (node, _) in list(self.seen.items()) if self.alive(address)}
+
+    def route(self, url):
+        """A channel-like handle for the partner at a udp:// URL."""
+        parsed = urlparse(url)
+        return LanRoute(self, (socket.gethostbyname(parsed.hostname), parsed.port or LAN_PORT), url)
+
+    def route_for(self, node):
+        """Route to a partner by node id, if it has been heard from recently."""
+        address = self.partners().get(node) if node else None
+        return LanRoute(self, address, f"udp://{address[0]}:{address[1]}") if address else None
+
+    def push_state(self, state, address=None):
+        """Send a state message to one partner, or every partner on the LAN; not retransmitted."""
+        message = {"type": "state", "src": self.node, "state": state}
+        for target in [address] if address else self.partners().values():
+            self._send(_encode(message, self.versions.get(target, 0)), target)
+
+    def close(self):
+        self._stopped.set()
+        with self._cond:
+            self._cond.notify()
+        if self.sock:
+            self.sock.close()
+        metrics.REGISTRY.remove("streamer_lan_peers")
+
+
+class LanRoute:
+    """The ControlChannel interface over a LanEndpoint, for one partner address."""
+
+    def __init__(self, endpoint, address, url):
+        self.endpoint = endpoint
+        self.address = address
+        self.url = url
+
+    @property
+    def connected(self):
+        return self.endpoint.alive(self.address)
+
+    def start(self):
+        return self
+
+    def wait_connected(self, timeout):
+        deadline = time.monotonic() + timeout
+        while not self.connected and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return self.connected
+
+    def request(self, action, params=None, timeout=5, **fields):
+        return self.endpoint.request(self.address, action, params, timeout, **fields)
+
+    def push_state(self, state):
+        self.endpoint.push_state(state, self.address)
+
+    def close(self):
+        pass  # The endpoint's socket is shared with the other partners
@@ -0,0 +1,141 @@
+import threading
+from bisect import bisect_left
+
+# Bucket upper bounds in seconds, from sub-millisecond LAN to slow tunnel links
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.035, 0.05, 0.075, 0.1,
+    0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0, 10.0,
+)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram:
+    """Fixed-bucket histogram; observing is one bisect and one uncontended lock.
+
+    Buckets are preallocated, so recording builds no lists or dicts and
+    leaves the hot path's timing alone.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket."""
+        counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if seen + count >= rank and count:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def samples(self, name, labels):
+        cumulative = 0
+        counts = list(self.counts)
+        for bound, count in zip(self.bounds, counts):
+            cumulative += count
+            yield f"{name}_bucket", labels + (("le", repr(bound)),), cumulative
+        yield f"{name}_bucket", labels + (("le", "+Inf"),), cumulative + counts[-1]
+        yield f"{name}_sum", labels, self.sum
+        yield f"{name}_count", labels, self.count
+
+
+class Gauge:
+    """A value read from a callback at scrape time, so it costs nothing to keep current."""
+
+    def __init__(self, read):
+        self.read = read
+
+    def samples(self, name, labels):
+        try:
+            value = self.read()
+        except Exception:
+            value = None
+        if value is not None:
+            yield name, labels, value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}  # (name, labels) -> metric
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help_text, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(key, factory())
+                self._help[name] = (kind, help_text)
+        return metric
+
+    def counter(self, name, help_text="", **labels):
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text="", **labels):
+        return self._get("histogram", name, help_text, labels, Histogram)
+
+    def gauge(self, name, read, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._metrics[key] = Gauge(read)
+            self._help[name] = ("gauge", help_text)
+
+    def remove(self, name, **labels):
+        with self._lock:
+            self._metrics.pop((name, tuple(sorted(labels.items()))), None)
+
+    def collect(self, name):
+        """Return (labels, metric) pairs for one metric name."""
+        return [(dict(labels), metric) for (key, labels), metric in list(self._metrics.items()) if key == name]
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        by_name = {}
+        for (name, labels), metric in sorted(self._metrics.items(), key=lambda item: item[0]):
+            by_name.setdefault(name, []).append((labels, metric))
+        for name, entries in by_name.items():
+            kind, help_text = self._help.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in entries:
+                for sample, sample_labels, value in metric.samples(name, labels):
+                    label_text = ",".join(f'{key}="{val}"' for key, val in sample_labels)
+                    lines.append(f"{sample}{{{label_text}}} {value}" if label_text else f"{sample} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
@@ -0,0 +1,284 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import metrics
+from clocksync import ClockSync
+from control import ControlChannel, control_address
+from lan import LAN_TIMEOUT
+from retry import CircuitBreaker, RetryPolicy
+
+
+def parse_peer_urls(text):
+    """Split a comma/whitespace separated list of partner URLs."""
+    urls = []
+    for url in text.replace(",", " ").split():
+        url = url.rstrip("/")
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+class Peer:
+    """One partner: its control channel, clock estimate and HTTP fallback.
+
+    With a LAN endpoint, a partner discovered on the local network is sent
+    commands as UDP datagrams first, whatever URL it was configured with;
+    udp:// URLs use the LAN endpoint as their only channel. A tcp:// URL
+    with a path, e.g. tcp://hub:5003/movie-night, is a room on a relay
+    hub (port.py), joined again after every reconnect. An https:// URL,
+    such as a devtunnel, has no control channel: commands, and the clock
+    and position probes, go over the keep-alive HTTP session.
+    """
+
+    def __init__(self, url, handler=None, on_state=None, lan=None, retry=None):
+        import requests  # Imported here: slow to load, and the engine starts without it
+
+        self.url = url
+        self.lan = lan
+        self.room = urlparse(url).path.strip("/") if url.startswith("tcp://") else None
+        self.retry = retry or RetryPolicy()
+        self.breaker = CircuitBreaker(self._probe)
+        self.node = None  # Partner's node id, learned from its acks
+        self.file_loaded = None  # Partner's load state as last acked or pushed; None if unknown
+        self.fingerprint = None  # Fingerprint of the partner's media, from the same sources
+        self.http = requests.Session()  # Keep-alive for the HTTP fallback
+        self.http_only = not url.startswith("udp://") and control_address(url) is None
+        if url.startswith("udp://") and lan:
+            self.channel = lan.route(url)
+        else:
+            self.channel = ControlChannel.for_url(
+                url, handler=handler, on_state=on_state, on_connect=self._join if self.room else None
+            )
+            self.channel.start()
+        self.clock = ClockSync(self.channel_request).start()  # Probes need a persistent connection's timing
+        self._rtt = {}  # (action, transport) -> histogram, looked up once per pair
+        self._fast_failures = metrics.counter("streamer_command_fast_failures_total", "Commands not sent because a circuit was open")
+        self._timeouts = {
+            transport: metrics.counter("streamer_command_timeouts_total", "Commands with no ack in time", transport=transport)
+            for transport in ("udp", "channel", "http")
+        }
+        metrics.gauge("streamer_peer_circuit_open", lambda: int(self.breaker.open), "1 while commands to the partner fail fast", peer=url)
+        metrics.gauge("streamer_clock_offset_seconds", lambda: self.clock.offset, "Estimated partner clock offset", peer=url)
+        metrics.gauge("streamer_clock_rtt_seconds", lambda: self.clock.rtt, "Smoothed partner round-trip time", peer=url)
+
+    def _join(self):
+        """Enter the hub room named in the URL; runs after every reconnect."""
+        self.channel.request("join", self.room, timeout=5)
+
+    def _observe(self, action, transport, elapsed):
+        histogram = self._rtt.get((action, transport))
+        if histogram is None:
+            histogram = self._rtt[action, transport] = metrics.histogram(
+                "streamer_command_rtt_seconds", "Command round-trip latency", command=action, transport=transport
+            )
+        histogram.observe(elapsed)
+
+    def _remember(self, reply):
+        self.node = reply.get("node", self.node)
+        self.file_loaded = reply.get("file_loaded", self.file_loaded)
+        self.fingerprint = reply.get("fingerprint", self.fingerprint)
+
+    def _lan_route(self):
+        if self.lan is None or self.url.startswith("udp://"):
+            return None
+        return self.lan.route_for(self.node)
+
+    def channel_request(self, action, params=None, timeout=5, **fields):
+        """Send over a persistent channel only (LAN if found), for probes that need its timing.
+
+        A partner with no control channel is probed over the HTTP session
+        instead, which keeps its connection alive between probes.
+        """
+        route = self._lan_route()
+        if route is None and self.http_only:
+            reply = self._http_request(action, params, timeout, fields)
+        else:
+            reply = (route or self.channel).request(action, params, timeout, **fields)
+        if reply is not None:
+            self._remember(reply)
+        return reply
+
+    def request(self, action, params=None, timeout=5, **fields):
+        """Send a command, retrying within a total deadline of `timeout`; None if undelivered.
+
+        While the peer's circuit is open the command fails at once.
+        """
+        if not self.breaker.allow():
+            self._fast_failures.inc()
+            return None
+        reply = self.retry.call(lambda attempt_timeout: self._attempt(action, params, attempt_timeout, fields), timeout)
+        if reply is None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return reply
+
+    def _attempt(self, action, params, timeout, fields):
+        """One try over LAN UDP, then the control channel, then HTTP, sharing `timeout`."""
+        end = time.perf_counter() + timeout
+        start = time.perf_counter()
+        reply = None
+        route = self._lan_route()
+        if route:
+            reply = route.request(action, params, min(timeout, LAN_TIMEOUT), **fields)
+            transport = "udp"
+        if reply is None:
+            start = time.perf_counter()
+            reply = self.channel.request(action, params, max(end - start, 0), **fields)
+            transport = "udp" if self.url.startswith("udp://") else "channel"
+        if reply is None and self.channel.connected:
+            self._timeouts[transport].inc()
+        if reply is None and not self.url.startswith(("tcp://", "udp://")) and time.perf_counter() < end:
+            start = time.perf_counter()
+            reply = self._http_request(action, params, end - start, fields)
+            transport = "http"
+        if reply is not None:
+            self._observe(action, transport, time.perf_counter() - start)
+            self._remember(reply)
+        return reply
+
+    def _http_request(self, action, params, timeout, fields):
+        import requests
+
+        url = f"{self.url}/{action}/{params}" if params is not None else f"{self.url}/{action}"
+        query = {key: int(value) if isinstance(value, bool) else value for key, value in fields.items() if value is not None}
+        if action == "seek":
+            # Whole seconds in the path, as peers that predate milliseconds read it; ?ms= for the rest
+            url = f"{self.url}/seek/{int(params) // 1000}"
+            query["ms"] = int(params)
+        try:
+            if action == "load_file":
+                response = self.http.post(url, params=query, timeout=timeout)
+            else:
+                response = self.http.get(url, params=query, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to send command to partner {self.url}: {action}. Error: {e}")
+            if isinstance(e, requests.exceptions.Timeout):
+                self._timeouts["http"].inc()
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            return response.json()
+        except ValueError:
+            return {"status": "success", "action": action}
+
+    def _probe(self):
+        """Background health check while the circuit is open."""
+        reply = self._attempt("is_file_loaded", None, 1.0, {})
+        return reply is not None and reply.get("status") == "success"  # A hub room answers errors for absent members
+
+    def close(self):
+        self.clock.stop()
+        self.breaker.close()
+        self.channel.close()
+        metrics.REGISTRY.remove("streamer_peer_circuit_open", peer=self.url)
+        metrics.REGISTRY.remove("streamer_clock_offset_seconds", peer=self.url)
+        metrics.REGISTRY.remove("streamer_clock_rtt_seconds", peer=self.url)
+
+
+class FanoutResult:
+    """Per-peer outcome of one fanned-out command."""
+
+    def __init__(self, acked, rejected, failed, stragglers, elapsed):
+        self.acked = acked  # url -> reply
+        self.rejected = rejected  # url -> error reply, e.g. media not loaded
+        self.failed = failed  # urls that answered with no ack
+        self.stragglers = stragglers  # urls with no answer by the deadline
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return bool(self.acked) and not (self.rejected or self.failed or self.stragglers)
+
+    def summary(self):
+        total = len(self.acked) + len(self.rejected) + len(self.failed) + len(self.stragglers)
+        text = f"Acked by {len(self.acked)}/{total} partners in {self.elapsed * 1000:.0f} ms."
+        if self.rejected:
+            text += f" Rejected by: {', '.join(self.rejected)}"
+        missing = self.failed + self.stragglers
+        if missing:
+            text += f" No ack from: {', '.join(missing)}"
+        return text
+
+
+class PeerSet:
+    """The partners in a session, with concurrent fan-out of commands.
+
+    Each command goes to every peer at once on a bounded thread pool, so
+    latency is that of the slowest peer rather than the sum of all of them.
+    """
+
+    def __init__(self, handler=None, on_state=None, max_workers=32, lan=None, retry=None):
+        self.handler = handler
+        self.on_state = on_state
+        self.lan = lan
+        self.retry = retry or RetryPolicy()
+        self.peers = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        self._fanout_seconds = metrics.histogram("streamer_fanout_seconds", "Time to collect acks from all partners")
+        self._stragglers = metrics.counter("streamer_fanout_stragglers_total", "Partners that missed the ack deadline")
+
+    def update(self, urls):
+        """Make the peer set match `urls`, keeping existing connections."""
+        for url in list(self.peers):
+            if url not in urls:
+                self.peers.pop(url).close()
+        for url in urls:
+            if url not in self.peers:
+                self.peers[url] = Peer(url, self.handler, self.on_state, self.lan, self.retry)
+
+    def __len__(self):
+        return len(self.peers)
+
+    def __iter__(self):
+        return iter(list(self.peers.values()))
+
+    def by_node(self, node):
+        for peer in self:
+            if node is not None and peer.node == node:
+                return peer
+        return None
+
+    def fanout(self, action, params=None, deadline=5, local_at=None, **fields):
+        """Send a command to every peer at once and collect acks until the deadline.
+
+        `local_at` is a local-clock execution time, converted per peer with
+        that peer's clock offset.
+        """
+        start = time.monotonic()
+        futures = {}
+        for peer in self:
+            at = None
+            if local_at is not None and peer.clock.synced:
+                at = peer.clock.to_remote(local_at)
+            future = self._pool.submit(peer.request, action, params, deadline, at=at, **fields)
+            futures[future] = peer.url
+        done, pending = wait(futures, timeout=deadline)
+        acked, rejected, failed = {}, {}, []
+        for future in done:
+            reply = future.result()
+            if reply is None:
+                failed.append(futures[future])
+            elif reply.get("status") == "error":
+                rejected[futures[future]] = reply
+            else:
+                acked[futures[future]] = reply
+        stragglers = [futures[future] for future in pending]
+        elapsed = time.monotonic() - start
+        self._fanout_seconds.observe(elapsed)
+        if stragglers:
+            self._stragglers.inc(len(stragglers))
+        return FanoutResult(acked, rejected, failed, stragglers, elapsed)
+
+    def lead_time(self):
+        """Schedule far enough ahead for the slowest synced peer."""
+        # Through a relay hub a command crosses two links: to the hub and on to the room
+        leads = [peer.clock.lead_time() * (2 if peer.room else 1) for peer in self if peer.clock.synced]
+        return max(leads) if leads else None
+
+    def close(self):
+        for peer in self:
+            peer.close()
+        self.peers.clear()
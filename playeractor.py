@@ -0,0 +1,215 @@
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+
+import vlc
+
+import metrics
+from clocksync import clock_now
+
+CONTROL, TUNE = 0, 1  # Transport, seeks and media first; rate nudges after them
+REFRESH_INTERVAL = 0.025  # Seconds between snapshot samples while playing
+SEEK_HOLD = 0.25  # Seconds the seek target stands in for VLC's position, which lags a seek
+
+
+class Snapshot:
+    """Player state as last sampled by the actor thread. Never mutated once published."""
+
+    __slots__ = ("time", "ts", "length", "rate", "state", "mute")
+
+    def __init__(self, time=-1, ts=0.0, length=-1, rate=1.0, state=vlc.State.NothingSpecial, mute=-1):
+        self.time = time  # ms at clock time ts
+        self.ts = ts
+        self.length = length
+        self.rate = rate
+        self.state = state
+        self.mute = mute
+
+    def replace(self, **changes):
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return Snapshot(**fields)
+
+
+class QueuedCall:
+    __slots__ = ("fn", "args", "future", "queued", "cancelled")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.future = Future()
+        self.queued = clock_now()
+        self.cancelled = False
+
+
+class PlayerActor:
+    """The one thread that touches libvlc; everyone else talks to it.
+
+    It has the vlc.MediaPlayer methods this app uses, so it drops in for
+    the player. Calls that change the player are queued and return at
+    once; the actor thread runs them in order, transport and seeks ahead
+    of rate nudges. A seek replaces any seek still queued, as only the
+    latest target matters. Reads never wait on libvlc: they come from a
+    snapshot the actor refreshes after every call and on player events,
+    and every `refresh` seconds only while playing or settling a seek, with
+    the position extrapolated while playing. Idle or paused, it just waits.
+    """
+
+    def __init__(self, player, refresh=REFRESH_INTERVAL):
+        self.player = player
+        self.refresh = refresh
+        self._snapshot = Snapshot(ts=clock_now())
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._replaceable = {}  # "seek"/"rate" -> the QueuedCall it would replace
+        self._hold_until = 0.0  # Until then samples keep the seek target as the position
+        self._lock = threading.Lock()
+        self._latency = metrics.histogram("streamer_player_queue_seconds", "Time player calls wait for the actor")
+        metrics.gauge("streamer_player_queue_depth", lambda: self._queue.qsize(), "Player calls waiting for the actor")
+        threading.Thread(target=self._run, name="player", daemon=True).start()
+
+    def submit(self, fn, *args, priority=CONTROL, replaces=None):
+        """Run fn(player, *args) on the actor thread; returns a Future of its result."""
+        call = QueuedCall(fn, args)
+        with self._lock:
+            if replaces:
+                previous = self._replaceable.get(replaces)
+                if previous is not None and not previous.future.done():
+                    previous.cancelled = True
+                    metrics.counter("streamer_player_calls_replaced_total", "Queued player calls superseded", kind=replaces).inc()
+                self._replaceable[replaces] = call
+            self._queue.put((priority, next(self._order), call))
+        return call.future
+
+    def _run(self):
+        while True:
+            sampling = self._snapshot.state == vlc.State.Playing or clock_now() < self._hold_until
+            try:
+                _, _, call = self._queue.get(timeout=self.refresh if sampling else None)
+            except queue.Empty:
+                self._sample()
+                continue
+            if call is None:
+                continue  # Woken to start sampling again
+            if call.cancelled:
+                call.future.cancel()
+                continue
+            self._latency.observe(clock_now() - call.queued)
+            try:
+                call.future.set_result(call.fn(self.player, *call.args))
+            except Exception as e:
+                print(f"Player call failed: {e}")
+                call.future.set_exception(e)
+            self._sample()
+
+    def _sample(self):
+        player = self.player
+        try:
+            time, ts = player.get_time(), clock_now()
+            snapshot = self._snapshot
+            if self._stale(time):
+                time, ts = snapshot.time, snapshot.ts
+            self._snapshot = Snapshot(
+                time=time, ts=ts, length=player.get_length(), rate=player.get_rate(),
+                state=player.get_state(), mute=player.audio_get_mute(),
+            )
+        except Exception as e:
+            print(f"Failed to sample player state: {e}")
+
+    def _stale(self, time):
+        """True for a position from before a seek, which VLC reports for a while after it."""
+        if clock_now() >= self._hold_until:
+            return False
+        if abs(time - self.get_time()) > 1000 * SEEK_HOLD:
+            return True
+        self._hold_until = 0.0  # VLC has caught up with the seek
+        return False
+
+    def on_player_event(self, name, value):
+        """Player event listener: fold events into the snapshot without calling libvlc."""
+        snapshot = self._snapshot
+        if name == "time":
+            if not self._stale(value):
+                self._snapshot = snapshot.replace(time=value, ts=clock_now())
+        elif name == "length":
+            self._snapshot = snapshot.replace(length=value)
+        elif name == "playing":
+            self._snapshot = snapshot.replace(state=vlc.State.Playing)
+            self._queue.put((TUNE, next(self._order), None))  # Wake the actor to sample while playing
+        elif name == "paused":
+            self._snapshot = snapshot.replace(time=self.get_time(), ts=clock_now(), state=vlc.State.Paused)
+        elif name == "stopped":
+            self._snapshot = snapshot.replace(time=0, ts=clock_now(), state=vlc.State.Stopped)
+        elif name == "end":
+            self._snapshot = snapshot.replace(state=vlc.State.Ended)
+
+    # Writes: queued, returning a Future of libvlc's result at once
+
+    def play(self):
+        return self.submit(lambda player: player.play())
+
+    def pause(self):
+        return self.submit(lambda player: player.pause())
+
+    def set_pause(self, do_pause):
+        return self.submit(lambda player: player.set_pause(do_pause))
+
+    def stop(self):
+        return self.submit(lambda player: player.stop())
+
+    def set_media(self, media):
+        return self.submit(lambda player: player.set_media(media))
+
+    def audio_set_mute(self, muted):
+        self._snapshot = self._snapshot.replace(mute=int(bool(muted)))
+        return self.submit(lambda player: player.audio_set_mute(muted))
+
+    def set_time(self, ms):
+        # Readers see the target at once, as they would after a synchronous seek
+        self._snapshot = self._snapshot.replace(time=int(ms), ts=clock_now())
+        self._hold_until = clock_now() + SEEK_HOLD
+        return self.submit(self._seek, int(ms), replaces="seek")
+
+    def _seek(self, player, ms):
+        player.set_time(ms)
+        # Publish the target again in case a sample from before the seek overwrote it
+        self._snapshot = self._snapshot.replace(time=ms, ts=clock_now())
+        self._hold_until = clock_now() + SEEK_HOLD
+
+    def set_rate(self, rate):
+        snapshot = self._snapshot
+        self._snapshot = snapshot.replace(time=self.get_time(), ts=clock_now(), rate=rate)
+        return self.submit(lambda player: player.set_rate(rate), priority=TUNE, replaces="rate")
+
+    # Reads: from the snapshot
+
+    def get_time(self):
+        snapshot = self._snapshot
+        if snapshot.state != vlc.State.Playing or snapshot.time < 0:
+            return snapshot.time
+        position = snapshot.time + int((clock_now() - snapshot.ts) * 1000 * snapshot.rate)
+        return min(position, snapshot.length) if snapshot.length > 0 else position
+
+    def get_length(self):
+        return self._snapshot.length
+
+    def get_rate(self):
+        return self._snapshot.rate
+
+    def get_state(self):
+        return self._snapshot.state
+
+    def is_playing(self):
+        return int(self._snapshot.state == vlc.State.Playing)
+
+    def audio_get_mute(self):
+        return self._snapshot.mute
+
+    # Handles that libvlc allows from any thread
+
+    def get_instance(self):
+        return self.player.get_instance()
+
+    def event_manager(self):
+        return self.player.event_manager()
@@ -0,0 +1,68 @@
+import threading
+import time
+
+import vlc
+
+# libvlc event -> (name, function extracting the value)
+EVENTS = {
+    vlc.EventType.MediaPlayerTimeChanged: ("time", lambda event: event.u.new_time),
+    vlc.EventType.MediaPlayerLengthChanged: ("length", lambda event: event.u.new_length),
+    vlc.EventType.MediaPlayerBuffering: ("buffering", lambda event: event.u.new_cache),
+    vlc.EventType.MediaPlayerPlaying: ("playing", lambda event: True),
+    vlc.EventType.MediaPlayerPaused: ("paused", lambda event: True),
+    vlc.EventType.MediaPlayerStopped: ("stopped", lambda event: True),
+    vlc.EventType.MediaPlayerEndReached: ("end", lambda event: True),
+}
+
+
+class PlayerEvents:
+    """libvlc player events, fanned out to listeners and batched for frontends.
+
+    Listeners (e.g. the sync logic) are called on libvlc's event thread for
+    every event. Frontends get only the latest value of each kind, at most
+    `max_rate` times a second, and only when something happened, so
+    nothing runs while the player is paused or idle.
+    """
+
+    def __init__(self, player, max_rate=10):
+        self.interval = 1.0 / max_rate
+        self.listeners = []
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._flush_pending = False
+        self._last_flush = 0.0
+        self._on_batch = None
+        manager = player.event_manager()
+        for event_type, (name, extract) in EVENTS.items():
+            manager.event_attach(event_type, self._on_event, name, extract)
+
+    def add_listener(self, listener):
+        """listener(name, value), called on libvlc's event thread."""
+        self.listeners.append(listener)
+
+    def bind_batches(self, on_batch):
+        """Deliver batches to on_batch({name: latest value}) on a timer thread."""
+        self._on_batch = on_batch
+
+    def _on_event(self, event, name, extract):
+        value = extract(event)
+        for listener in self.listeners:
+            try:
+                listener(name, value)
+            except Exception as e:
+                print(f"Player event listener failed: {e}")
+        with self._lock:
+            self._latest[name] = value
+            if self._flush_pending or self._on_batch is None:
+                return
+            self._flush_pending = True
+        # Hold the batch back until the display interval has passed
+        wait = self._last_flush + self.interval - time.monotonic()
+        threading.Timer(max(0.0, wait), self._flush).start()
+
+    def _flush(self):
+        with self._lock:
+            batch, self._latest = self._latest, {}
+            self._flush_pending = False
+        self._last_flush = time.monotonic()
+        self._on_batch(batch)
@@ -1,43 +1,492 @@
+"""Relay hub: peers join rooms over persistent connections and the hub fans out their commands.
+
+Peers that cannot reach each other directly (e.g. both behind NAT) use
+tcp://<hub>:5003/<room> as their partner URL. The hub keeps each room's
+authoritative session state, so a peer joining late catches up from the
+hub, and runs on a single asyncio event loop.
+
+The hub port speaks length-prefixed TCP, which a VS Code or devtunnel
+port forward cannot carry, as those relay only HTTP(S). Only the Flask
+status page on 5000 is forwarded; peers reach 5003 on the LAN, on a
+public address, or through a plain TCP forward.
+
+    python port.py                          # forward port 5000 and run the hub
+    python port.py --load-test --clients 2000 --rooms 200 [--binary]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import statistics
 import subprocess
+import sys
 import time
+from threading import Thread
+
 from flask import Flask
 from waitress import serve
-from threading import Thread
+
+from clocksync import clock_now
+from control import MAX_FRAME, _header, encode_frame, encode_frames, wire_reply
+from session import Session
+from wire import WIRE_VERSION, decode
+
+HUB_PORT = 5003
+PROBE_INTERVAL = 2.0  # Seconds between clock probes of each member
+PROBE_WINDOW = 8
+MAX_BUFFERED = 1 << 20  # Drop a member whose unsent relays exceed this many bytes
+GATHERED = ("load_file", "prepare", "ready", "is_file_loaded")  # Answered from every member's reply
+GATHER_TIMEOUT = 0.8  # Seconds to wait for members' replies; under the senders' 1 s poll timeouts
 
 app = Flask(__name__)
+hub = None
+
 
 @app.route('/')
 def home():
-    return "Hello, the server is running!"
+    if hub is None:
+        return "Hello, the server is running!"
+    stats = hub.stats()
+    return f"Relay hub running: {stats['rooms']} rooms, {stats['members']} members, {stats['relayed']} commands relayed."
+
 
 def start_server():
     """Start the Flask server."""
     serve(app, host='0.0.0.0', port=5000)
 
-def forward_port():
-    """Forward port 5000 using VS Code API."""
+
+def forward_port(port=5000, label="Public Flask Server"):
+    """Forward a port using VS Code API."""
     try:
         # Run VS Code command for port forwarding
         subprocess.run(
             [
-                "code", 
-                "--executeCommand", 
+                "code",
+                "--executeCommand",
                 "remote.forwardPort",
-                '{"port":5000,"onAutoForward":"openBrowser","label":"Public Flask Server"}'
+                json.dumps({"port": port, "onAutoForward": "openBrowser", "label": label}),
             ],
             check=True,
         )
-        print("Port 5000 forwarded successfully.")
-    except subprocess.CalledProcessError as e:
-        print("Failed to forward port 5000:", e)
+        print(f"Port {port} forwarded successfully.")
+    except (subprocess.CalledProcessError, OSError) as e:
+        print(f"Failed to forward port {port}:", e)
 
-if __name__ == "__main__":
-    # Forward the port first
-    forward_port()
 
-    # Give some time for the port to be ready
-    time.sleep(3)  # Adjust the sleep time if necessary
+class Member:
+    """One peer connection: its room, wire format and an estimate of its clock."""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.room = None
+        self.version = 0  # Wire format of frames to this member
+        self.offset = None  # member clock minus hub clock, in seconds
+        self.samples = []
+        self.pending = {}  # probe id -> future for the member's ack
+        self.ids = itertools.count(1)
+
+    def send(self, frame):
+        if self.writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+            self.writer.close()  # Too slow to keep up; it rejoins and catches up
+            return
+        self.writer.write(frame)
+
+    def send_message(self, message):
+        self.send(encode_frame(message, self.version))
+
+    def to_member(self, hub_ts):
+        return hub_ts + self.offset
+
+
+class Room:
+    def __init__(self, name):
+        self.name = name
+        self.members = set()
+        self.session = Session()  # Authoritative state; there is no player here
+
+
+class RelayHub:
+    """Rooms of peers on one event loop; every command is relayed to the rest of its room.
+
+    The sender is acked as soon as the relay frames are queued, without
+    waiting for the other members. A command scheduled with `at` arrives
+    in hub time, because the sender's clock estimate is of the hub, and
+    is converted to each member's clock from the hub's own probes of that
+    member. Room state follows the Session journal, so "catch_up" is
+    answered by the hub. Load and readiness queries (GATHERED) are asked
+    of every other member instead, and the sender is answered from their
+    replies once they are in. Each member gets frames in the wire format
+    it agreed to, and a relay is encoded once per format.
+    """
+
+    def __init__(self, host="0.0.0.0", port=HUB_PORT):
+        self.address = (host, port)
+        self.rooms = {}
+        self.members = 0
+        self.relayed = 0
+        self._gathers = set()  # Running gather tasks, kept referenced until done
+
+    def serve_forever(self):
+        asyncio.run(self.serve())
+
+    async def serve(self, ready=None):
+        server = await asyncio.start_server(self._serve_member, *self.address, backlog=4096)
+        if ready:
+            ready.set_result(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+    def stats(self):
+        return {"rooms": len(self.rooms), "members": self.members, "relayed": self.relayed}
+
+    async def _serve_member(self, reader, writer):
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        member = Member(writer)
+        self.members += 1
+        prober = asyncio.create_task(self._probe(member))
+        try:
+            while True:
+                (size,) = _header.unpack(await reader.readexactly(_header.size))
+                if size > MAX_FRAME:
+                    break
+                replies = [self._dispatch(member, message) for message in decode(await reader.readexactly(size))]
+                replies = [reply for reply in replies if reply is not None]
+                if replies:
+                    member.send(encode_frames(replies, member.version))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            prober.cancel()
+            self.members -= 1
+            self._leave(member)
+            writer.close()
+
+    def _leave(self, member):
+        room = member.room
+        if room:
+            room.members.discard(member)
+            if not room.members:
+                del self.rooms[room.name]
+        member.room = None
+
+    def _dispatch(self, member, message):
+        """Handle one message from a member; returns the reply to send it, if any."""
+        kind = message.get("type")
+        if kind == "ack":
+            future = member.pending.pop(message.get("id"), None)
+            if future and not future.done():
+                future.set_result(message)
+            return None
+        if kind == "state":
+            if member.room:
+                self._fan_out([other for other in member.room.members if other is not member], message)
+            return None
+        if kind == "wire":
+            member.version, reply = wire_reply(message)
+            return reply
+        if kind != "cmd":
+            return None
+        if message.get("action") in GATHERED and member.room:
+            if message["action"] == "load_file":
+                member.room.session.record("load", fingerprint=message.get("fingerprint"))
+            task = asyncio.get_running_loop().create_task(self._gather(member, message))
+            self._gathers.add(task)
+            task.add_done_callback(self._gathers.discard)
+            return None  # _gather acks once the members have answered
+        reply = self._command(member, message)
+        return dict(reply, type="ack", id=message.get("id"))
+
+    @staticmethod
+    def _fan_out(members, message):
+        frames = {}  # Encoded once per wire version
+        for member in members:
+            if member.version not in frames:
+                frames[member.version] = encode_frame(message, member.version)
+            member.send(frames[member.version])
 
-    # Start the Flask server
-    print("Starting the Flask server...")
-    Thread(target=start_server, daemon=True).start()
+    def _command(self, member, message):
+        action, params = message["action"], message.get("params")
+        if action == "clock":
+            received = clock_now()
+            return {"status": "success", "recv": received, "send": clock_now()}
+        if action == "join":
+            self._leave(member)
+            room = self.rooms.get(params) or self.rooms.setdefault(params, Room(params))
+            room.members.add(member)
+            member.room = room
+            return {"status": "success", "room": params, "members": len(room.members)}
+        room = member.room
+        if room is None:
+            return {"status": "error", "message": "Join a room first"}
+        if action == "catch_up":
+            return dict(room.session.catch_up(params), status="success")
+        if action == "position":
+            state = room.session.state
+            now = clock_now()
+            return {"status": "success", "pos": int(Session.position_at(state, now)), "ts": now,
+                    "playing": state["playing"], "rate": state["rate"]}
+        if action in ("play", "pause", "seek", "stop"):
+            room.session.record(action, params, at=message.get("at"))
+        delivered = self._relay(member, message)
+        return {"status": "success", "action": action, "relayed": delivered}
+
+    def _relay(self, sender, message):
+        """Queue the command for every other member of the sender's room."""
+        others = [member for member in sender.room.members if member is not sender]
+        at = message.get("at")
+        if at is None:
+            self._fan_out(others, dict(message, id=0))
+        else:
+            for member in others:
+                if member.offset is not None:
+                    member.send_message(dict(message, id=0, at=member.to_member(at)))
+                else:
+                    fields = {k: v for k, v in message.items() if k != "at"}
+                    member.send_message(dict(fields, id=0))  # No clock estimate yet: apply on arrival
+        self.relayed += 1
+        return len(others)
+
+    async def _ask(self, member, message, timeout):
+        """Send a command to one member and wait for its ack; None on timeout."""
+        msg_id = next(member.ids)
+        future = member.pending[msg_id] = asyncio.get_running_loop().create_future()
+        member.send_message(dict(message, id=msg_id))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            member.pending.pop(msg_id, None)
+            return None
+
+    async def _gather(self, sender, message):
+        """Ask every other member of the sender's room and ack the sender from their replies."""
+        others = [member for member in sender.room.members if member is not sender]
+        replies = await asyncio.gather(*(self._ask(member, message, GATHER_TIMEOUT) for member in others))
+        if sender.room is None:
+            return  # The sender left while we were asking
+        reply = self._combine(message["action"], replies)
+        sender.send_message(dict(reply, type="ack", id=message.get("id")))
+
+    @staticmethod
+    def _combine(action, replies):
+        """One ack for a room from its members' acks (None for a member that did not answer).
+
+        It is a success only when every member answered with one, so a room
+        is never reported loaded or ready on a member's behalf; only a ready
+        poll is answered with members missing, as not ready yet. The load
+        state tags are those of all members together: loaded if all of them
+        are, and a fingerprint only if they agree; otherwise their distinct
+        fingerprints joined, which matches nobody's. The node is the
+        member's when there is exactly one.
+        """
+        if not replies:
+            return {"status": "error", "reason": "not_ready", "message": "No other member in the room"}
+        answered = [answer for answer in replies if answer is not None]
+        missing = len(replies) - len(answered)
+        rejected = [answer for answer in answered if answer.get("status") != "success"]
+        if rejected:
+            return dict(rejected[0], members=len(replies))
+        if missing and action != "ready":
+            return {"status": "error", "message": f"{missing} of {len(replies)} members did not answer"}
+        reply = {"status": "success", "action": action, "members": len(replies)}
+        if not missing:
+            fingerprints = sorted({answer.get("fingerprint") for answer in answered} - {None})
+            reply["file_loaded"] = all(answer.get("file_loaded") for answer in answered)
+            if fingerprints:
+                reply["fingerprint"] = ",".join(fingerprints)
+            if len(answered) == 1 and answered[0].get("node"):
+                reply["node"] = answered[0]["node"]
+        if action == "load_file":
+            reply["match"] = all(answer.get("match") for answer in answered)
+        elif action == "prepare":
+            reply["target"] = answered[0].get("target")
+        elif action == "ready":
+            # A member that did not answer is not ready yet; the sender polls again
+            targets = {answer.get("target") for answer in answered}
+            reply["ready"] = not missing and len(targets) == 1 and all(answer.get("ready") for answer in answered)
+            reply["target"] = targets.pop() if len(targets) == 1 else None
+            buffers = [answer["buffer"] for answer in answered if answer.get("buffer") is not None]
+            reply["buffer"] = min(buffers) if buffers else None
+        return reply
+
+    async def _probe(self, member):
+        """Keep an NTP-style estimate of the member's clock, as ClockSync does for peers."""
+        delay = 0.05
+        while True:
+            t0 = clock_now()
+            reply = await self._ask(member, {"type": "cmd", "action": "clock", "params": None}, 2)
+            t3 = clock_now()
+            if reply and "recv" in reply:
+                rtt = (t3 - t0) - (reply["send"] - reply["recv"])
+                member.samples.append((rtt, ((reply["recv"] - t0) + (reply["send"] - t3)) / 2))
+                del member.samples[:-PROBE_WINDOW]
+                member.offset = min(member.samples)[1]
+            if len(member.samples) >= PROBE_WINDOW:
+                delay = PROBE_INTERVAL
+            await asyncio.sleep(delay)
+
+
+async def simulated_client(port, room, sender, commands, interval, latencies, ready, go, version=0):
+    """Join a room, answer the hub's probes and record relay latency; binary frames from `version` 1."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    if version:
+        writer.write(encode_frame({"type": "wire", "version": version, "offer": True}))
+    writer.write(encode_frame({"type": "cmd", "id": 1, "action": "join", "params": room}, version))
+    received = 0
+
+    async def read_loop():
+        nonlocal received
+        while True:
+            (size,) = _header.unpack(await reader.readexactly(_header.size))
+            for message in decode(await reader.readexactly(size)):
+                if message.get("type") != "cmd":
+                    continue
+                if message["action"] == "clock":
+                    now = clock_now()
+                    ack = {"type": "ack", "id": message["id"], "status": "success", "recv": now, "send": now}
+                    writer.write(encode_frame(ack, version))
+                else:
+                    latencies.append(clock_now() - message["sent"])  # Same host, same monotonic clock
+                    received += 1
+
+    task = asyncio.create_task(read_loop())
+    ready.release()
+    await go.wait()
+    await asyncio.sleep(random.uniform(0, interval))  # Senders in different rooms are not in lockstep
+    for i in range(commands):
+        if sender:
+            writer.write(encode_frame({
+                "type": "cmd", "id": 100 + i, "action": "seek", "params": i, "seq": i + 1, "sent": clock_now(),
+            }, version))
+        await asyncio.sleep(interval)
+    await asyncio.sleep(1.0)  # Let the last relays arrive
+    task.cancel()
+    writer.close()
+    return received
+
+
+def raise_fd_limit(wanted=65536):
+    """Raise the open file limit towards `wanted` for the load test's many sockets; best effort."""
+    try:
+        import resource
+    except ImportError:
+        return  # Windows: no per-process descriptor limit to raise
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < limit:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        except (ValueError, OSError) as e:  # E.g. macOS caps the soft limit below the hard one
+            print(f"Could not raise the open file limit to {limit}: {e}")
+
+
+def hub_cpu_seconds():
+    """CPU time used by the finished hub process; None where it cannot be read."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def run_load_test(args):
+    """Run the hub in a child process and drive it with simulated clients from this one.
+
+    Relay latency includes the simulated clients' own time to parse what
+    they receive. When both processes share one core, the hub's CPU time
+    shows how much of that core it actually used.
+    """
+    port = args.port
+    proc = subprocess.Popen([sys.executable, __file__, "--hub-only", "--port", str(port)])
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+    latencies = []
+    ready = asyncio.Semaphore(0)
+    go = asyncio.Event()
+    start = clock_now()
+    tasks = []
+    for i in range(args.clients):
+        room = f"room-{i % args.rooms}"
+        sender = i < args.rooms  # The first member of each room sends
+        tasks.append(asyncio.create_task(simulated_client(
+            port, room, sender, args.commands, args.interval, latencies, ready, go, WIRE_VERSION if args.binary else 0
+        )))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)  # Stay under the listen backlog
+    for _ in tasks:
+        await ready.acquire()
+    connect_time = clock_now() - start
+    go.set()
+    received = await asyncio.gather(*tasks)
+    proc.terminate()
+    proc.wait()
+
+    ordered = sorted(latencies)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000 if ordered else None
+
+    expected = (args.clients - args.rooms) * args.commands
+    results = {
+        "config": vars(args),
+        "python": platform.python_version(),
+        "connect_all_seconds": connect_time,
+        "relays_expected": expected,
+        "relays_received": sum(received),
+        "hub_cpu_seconds": hub_cpu_seconds(),
+        "relay_latency_ms": {
+            "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99),
+            "mean": statistics.fmean(ordered) * 1000 if ordered else None,
+        },
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+def main():
+    global hub
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=HUB_PORT, help="hub TCP port")
+    parser.add_argument("--no-forward", action="store_true", help="skip VS Code port forwarding")
+    parser.add_argument("--load-test", action="store_true", help="measure the hub with simulated clients")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--commands", type=int, default=20, help="commands sent by each room's sender")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between a sender's commands")
+    parser.add_argument("--binary", action="store_true", help="simulated clients use the binary wire format")
+    parser.add_argument("--output", help="write load-test results to this JSON file")
+    parser.add_argument("--hub-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.load_test or args.hub_only:
+        raise_fd_limit()
+    if args.load_test:
+        asyncio.run(run_load_test(args))
+        return
+    hub = RelayHub(port=args.port)
+    if not args.hub_only:
+        if not args.no_forward:
+            forward_port()  # HTTP only; the hub port cannot go through this kind of forward
+        print("Starting the Flask server...")
+        Thread(target=start_server, daemon=True).start()
+        print(f"Relay hub listening on port {args.port} (pid {os.getpid()})")
+    hub.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
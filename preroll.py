@@ -0,0 +1,79 @@
+import threading
+import time
+
+import vlc
+
+PREPARE_TIMEOUT = 5.0  # Longest a peer spends warming up before it reports ready anyway
+
+
+class Preroller:
+    """Warm the local decoder at a position before a synchronized start.
+
+    `begin(ms)` plays the media muted from `ms` until VLC reports its
+    input buffer full, then pauses and returns to `ms`. The player is then
+    paused on a decoded frame with the demuxer and decoder warm, so the
+    scheduled play starts at once instead of after a disk- and CPU-bound
+    open, and `ready` tells the host it can issue the start.
+    """
+
+    def __init__(self, player, timeout=PREPARE_TIMEOUT):
+        self.player = player
+        self.timeout = timeout
+        self.target = None
+        self.ready = False
+        self.buffer = 0.0  # VLC's last buffering level, in percent
+        self.elapsed = None  # Seconds the last prepare took
+        self._generation = 0
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()  # One prepare drives the player at a time
+
+    def on_player_event(self, name, value):
+        """Player event listener: track buffering and state changes."""
+        with self._cond:
+            if name == "buffering":
+                self.buffer = value
+            self._cond.notify_all()
+
+    def begin(self, ms):
+        """Start preparing at `ms` in the background; `ready` turns True when done."""
+        with self._cond:
+            self._generation += 1
+            generation = self._generation
+            self.target = ms
+            self.ready = False
+        threading.Thread(target=self.prepare, args=(ms, generation), daemon=True).start()
+
+    def status(self):
+        return {"ready": self.ready, "target": self.target, "buffer": self.buffer, "elapsed": self.elapsed}
+
+    def _wait(self, condition, end):
+        with self._cond:
+            return self._cond.wait_for(condition, max(0.0, end - time.monotonic()))
+
+    def prepare(self, ms, generation=None):
+        """Warm up at `ms` and pause there; blocks until done or the timeout runs out."""
+        start = time.monotonic()
+        end = start + self.timeout
+        player = self.player
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return  # A newer prepare replaced this one
+            muted = player.audio_get_mute() == 1  # -1 while there is no audio output
+            player.audio_set_mute(True)
+            try:
+                if player.get_state() != vlc.State.Playing:
+                    player.play()
+                    self._wait(lambda: player.get_state() in (vlc.State.Playing, vlc.State.Error), end)
+                with self._cond:
+                    self.buffer = 0.0
+                player.set_time(ms)
+                self._wait(lambda: self.buffer >= 100, end)
+                player.set_pause(1)
+                self._wait(lambda: player.get_state() != vlc.State.Playing, end)
+                player.set_time(ms)  # Back to the target the muted playback ran past
+            finally:
+                player.audio_set_mute(muted)
+            with self._cond:
+                if generation is None or generation == self._generation:
+                    self.elapsed = time.monotonic() - start
+                    self.ready = True
@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+
+import metrics
+
+
+class RetryPolicy:
+    """Retry an attempt until it succeeds or a total deadline runs out.
+
+    Each attempt gets at most `attempt_timeout`, cut short by whatever is
+    left of the deadline, and attempts are spaced by exponential backoff
+    with full jitter. Senders that failed together therefore do not retry
+    together, and the deadline bounds the worst case a click can cost.
+    """
+
+    def __init__(self, deadline=5.0, attempt_timeout=2.0, base=0.05, cap=1.0):
+        self.deadline = deadline
+        self.attempt_timeout = attempt_timeout
+        self.base = base
+        self.cap = cap
+        self._retries = metrics.counter("streamer_command_retries_total", "Command attempts retried")
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def call(self, attempt, deadline=None):
+        """Run attempt(timeout) until it returns non-None; None once the deadline passes."""
+        end = time.monotonic() + (self.deadline if deadline is None else deadline)
+        tries = 0
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                return None
+            result = attempt(min(self.attempt_timeout, remaining))
+            if result is not None:
+                return result
+            delay = self.backoff(tries)
+            tries += 1
+            if time.monotonic() + delay >= end:
+                return None
+            self._retries.inc()
+            time.sleep(delay)
+
+
+class CircuitBreaker:
+    """Per-peer circuit breaker: stop sending to a peer that keeps failing.
+
+    After `threshold` consecutive failures the circuit opens and `allow()`
+    returns False at once, so commands to a dead partner fail without
+    waiting on the network. While it is open, `probe` (a function returning
+    True if the peer answered) runs in the background with backoff up to
+    `max_interval`, and the first success closes the circuit again.
+    """
+
+    def __init__(self, probe=None, threshold=3, interval=0.5, max_interval=10.0):
+        self.probe = probe
+        self.threshold = threshold
+        self.interval = interval
+        self.max_interval = max_interval
+        self.failures = 0
+        self.open = False
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def allow(self):
+        return not self.open
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.open = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.open or self.failures < self.threshold:
+                return
+            self.open = True
+        metrics.counter("streamer_circuit_opened_total", "Times a partner's circuit opened").inc()
+        if self.probe:
+            threading.Thread(target=self._probe_until_closed, daemon=True).start()
+
+    def _probe_until_closed(self):
+        interval = self.interval
+        while self.open and not self._closed.wait(interval):
+            try:
+                answered = self.probe()
+            except Exception:
+                answered = False
+            if answered:
+                self.record_success()
+                return
+            interval = min(interval * 2, self.max_interval)
+
+    def close(self):
+        """Stop background probing for good, e.g. when the peer is removed."""
+        self._closed.set()
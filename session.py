@@ -0,0 +1,92 @@
+import threading
+
+from clocksync import clock_now
+
+CHECKPOINT_EVERY = 64  # Journal entries kept before they are folded into the checkpoint
+
+
+class Session:
+    """Authoritative playback state with a compact command journal.
+
+    The state is the loaded media's fingerprint, a position at a
+    timestamp, the rate and whether playback runs, so the position at any
+    later moment follows without asking the player. Every change is
+    appended to the journal as the state it produced. Once the journal
+    grows past `CHECKPOINT_EVERY` entries it is folded into a checkpoint.
+
+    A peer catching up therefore gets at most a checkpoint and a bounded
+    delta in one reply, never the whole history. A peer that was only
+    briefly away gets just the entries after the version it already has.
+    """
+
+    def __init__(self, position=None):
+        self.position = position  # position() -> current player time in ms, or None
+        self.state = {"v": 0, "fingerprint": None, "pos": 0, "ts": clock_now(), "rate": 1.0, "playing": False}
+        self.checkpoint = dict(self.state)
+        self.journal = []  # [v, action, pos, ts, rate, playing, fingerprint] after the checkpoint
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self.state["v"]
+
+    def record(self, action, params=None, fingerprint=None, at=None):
+        """Append the effect of a command applied to the local player, or due at `at`."""
+        now = clock_now() if at is None else at
+        with self._lock:
+            state = self.state
+            pos = self.position_at(state, now)
+            if self.position:
+                sampled = self.position()
+                if sampled is not None and sampled >= 0:
+                    pos = sampled
+            playing, rate = state["playing"], state["rate"]
+            if action == "play":
+                playing = True
+            elif action == "pause":
+                playing = not playing  # Mirrors VLC's toggling pause()
+            elif action == "seek":
+                pos = int(params)  # Target in ms
+            elif action == "stop":
+                pos, playing = 0, False
+            elif action == "rate":
+                rate = float(params)
+            elif action == "sync":
+                pos, playing, rate = params  # Adopted from a partner's session
+            elif action == "load":
+                pos, playing, fingerprint = 0, False, fingerprint or params
+            else:
+                return
+            entry = [state["v"] + 1, action, pos, now, rate, playing, fingerprint or state["fingerprint"]]
+            self._apply(entry)
+            self.journal.append(entry)
+            if len(self.journal) > CHECKPOINT_EVERY:
+                self.checkpoint = dict(self.state)
+                self.journal = []
+
+    def _apply(self, entry):
+        v, _, pos, ts, rate, playing, fingerprint = entry
+        self.state = {"v": v, "fingerprint": fingerprint, "pos": pos, "ts": ts, "rate": rate, "playing": playing}
+
+    @staticmethod
+    def position_at(state, ts):
+        """Position in ms the state implies at time `ts` on the same clock."""
+        if not state["playing"]:
+            return state["pos"]
+        return state["pos"] + max(0.0, ts - state["ts"]) * 1000 * state["rate"]
+
+    def catch_up(self, since=None):
+        """Reply to a peer that has seen up to version `since` (None if nothing)."""
+        with self._lock:
+            if since is not None and since >= self.checkpoint["v"]:
+                delta = [entry for entry in self.journal if entry[0] > since]
+                return {"snapshot": None, "journal": delta, "now": clock_now()}
+            return {"snapshot": dict(self.checkpoint), "journal": list(self.journal), "now": clock_now()}
+
+    @staticmethod
+    def fold(snapshot, journal):
+        """The state after applying a catch-up delta to a snapshot."""
+        state = dict(snapshot) if snapshot else None
+        for v, _, pos, ts, rate, playing, fingerprint in journal:
+            state = {"v": v, "fingerprint": fingerprint, "pos": pos, "ts": ts, "rate": rate, "playing": playing}
+        return state
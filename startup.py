@@ -0,0 +1,26 @@
+"""Startup phase timings for the frontend and the engine.
+
+Times are from this module's import, which entry points do first. The
+bootloader unpacking the bundle and the interpreter's own start happen
+before that; bench_startup.py times launches from the outside to see them.
+"""
+import time
+
+import metrics
+
+T0 = time.perf_counter()
+phases = {}  # phase -> seconds after T0, in the order reached
+
+
+def mark(phase):
+    """Record that startup reached `phase`; a phase is timed the first time only."""
+    if phase not in phases:
+        phases[phase] = time.perf_counter() - T0
+        metrics.gauge("streamer_startup_seconds", lambda: phases[phase], "Time from launch to each startup phase",
+                      phase=phase)
+    return phases[phase]
+
+
+def report():
+    """Phase timings in ms, for logs and the startup benchmark."""
+    return {phase: round(seconds * 1000, 1) for phase, seconds in phases.items()}
@@ -0,0 +1,202 @@
+import itertools
+import os
+import queue
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+from fingerprint import CACHE_DIR
+from keyframes import KeyframeIndex
+from transfer import chunk_hash, fetch_manifest
+
+STREAM_CACHE_DIR = os.path.join(CACHE_DIR, "stream")
+READ_AHEAD = 8  # Chunks fetched ahead of the playhead
+MAX_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+
+DEMAND, READ_AHEAD_PRIORITY = 0, 1
+
+
+def _other_films(directory, fingerprint):
+    """Cache directories of films other than `fingerprint`, oldest first, with their sizes."""
+    films = []
+    for entry in os.scandir(directory):
+        if entry.is_dir() and entry.name != fingerprint:
+            size = sum(os.path.getsize(os.path.join(entry.path, name)) for name in os.listdir(entry.path))
+            films.append((entry.stat().st_mtime, entry.path, size))
+    return [(path, size) for _, path, size in sorted(films)]
+
+
+class StreamCache:
+    """On-disk chunk cache of a partner's media, filled on demand.
+
+    Reads block until their chunk is present. A missing chunk is fetched
+    at demand priority, ahead of everything else, and the chunks after it
+    are queued as read-ahead. A seek starts a new generation, so stale
+    read-ahead for the old position is skipped. `max_bytes` bounds the
+    whole cache directory: past it, the chunks of earlier films go first,
+    oldest film first, then this film's least recently used chunks, except
+    the ones around the playhead.
+
+    With the partner's keyframe index, a seek can prefetch the chunks
+    holding the target keyframe before the player asks for them.
+    """
+
+    def __init__(self, base_url, manifest, directory=STREAM_CACHE_DIR, max_bytes=MAX_CACHE_BYTES, workers=3):
+        self.base_url = base_url.rstrip("/")
+        self.manifest = manifest
+        self.size = manifest["size"]
+        self.chunk_size = manifest["chunk_size"]
+        self.count = len(manifest["hashes"])
+        self.directory = os.path.join(directory, manifest["fingerprint"])
+        self.max_bytes = max_bytes
+        self.playhead = 0
+        self.generation = 0
+        self.keyframes = None  # Partner's KeyframeIndex, once load_keyframes() got it
+        self._present = OrderedDict()  # index -> size, in LRU order
+        self._arrived = {}  # index -> Event for chunks being fetched
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(".chunk"):
+                index = int(name[:-6])
+                self._present[index] = os.path.getsize(os.path.join(self.directory, name))
+        self._others = _other_films(directory, manifest["fingerprint"])  # [(path, bytes)], oldest first
+        self._evict()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    @classmethod
+    def for_partner(cls, base_url, **kwargs):
+        """A cache for the partner's file, once it has finished hashing it."""
+        return cls(base_url, fetch_manifest(base_url.rstrip("/")), **kwargs)
+
+    def load_keyframes(self, attempts=30, interval=1.0):
+        """Fetch the partner's keyframe index, waiting while it is still being built."""
+        import requests
+
+        for _ in range(attempts):
+            response = requests.get(f"{self.base_url}/media/keyframes", timeout=10)
+            if response.status_code == 200:
+                self.keyframes = KeyframeIndex.from_json(response.json())
+                return self.keyframes
+            if response.status_code != 503:
+                return None  # The partner's format has no index
+            time.sleep(interval)
+        return None
+
+    def prefetch(self, offsets, span=2):
+        """Fetch the chunks at byte `offsets`, and `span` chunks from each, for an upcoming seek."""
+        self.generation += 1  # Read-ahead for the old position is no longer wanted
+        for offset in offsets:
+            first = offset // self.chunk_size
+            for index in range(first, min(first + span, self.count)):
+                self._request(index, READ_AHEAD_PRIORITY, self.generation)
+
+    def _path(self, index):
+        return os.path.join(self.directory, f"{index}.chunk")
+
+    def _request(self, index, priority, generation):
+        with self._lock:
+            if index in self._present:
+                return None
+            event = self._arrived.get(index)
+            if event is not None and priority != DEMAND:
+                return event
+            if event is None:
+                event = self._arrived[index] = threading.Event()
+        # A demand for a chunk already queued as read-ahead jumps the queue
+        self._queue.put((priority, next(self._order), index, generation))
+        return event
+
+    def _worker(self):
+        import requests
+
+        session = requests.Session()
+        while True:
+            priority, _, index, generation = self._queue.get()
+            if index in self._present:
+                continue  # Already fetched through a higher-priority entry
+            in_window = self.playhead <= index <= self.playhead + READ_AHEAD
+            if priority == READ_AHEAD_PRIORITY and generation != self.generation and not in_window:
+                with self._lock:
+                    event = self._arrived.pop(index, None)
+                if event:
+                    event.set()  # Read-ahead for a position we seeked away from
+                continue
+            try:
+                self._fetch(session, index)
+            except Exception as e:
+                print(f"Failed to fetch stream chunk {index}: {e}")
+            with self._lock:
+                event = self._arrived.pop(index, None)
+            if event:
+                event.set()
+
+    def _fetch(self, session, index):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size) - 1
+        response = session.get(f"{self.base_url}/media", headers={"Range": f"bytes={start}-{end}"}, timeout=30)
+        data = response.content
+        if response.status_code != 206 or chunk_hash(data) != self.manifest["hashes"][index]:
+            raise RuntimeError("chunk failed verification")
+        tmp = f"{self._path(index)}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(index))
+        with self._lock:
+            self._present[index] = len(data)
+        self._evict()
+
+    def _evict(self):
+        pinned = range(self.playhead - 2, self.playhead + READ_AHEAD + 1)
+        with self._lock:
+            total = sum(self._present.values()) + sum(size for _, size in self._others)
+            while self._others and total > self.max_bytes:
+                path, size = self._others.pop(0)
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+            for index in list(self._present):
+                if total <= self.max_bytes:
+                    break
+                if index in pinned:
+                    continue
+                total -= self._present.pop(index)
+                try:
+                    os.remove(self._path(index))
+                except OSError:
+                    pass
+
+    def _chunk(self, index):
+        """Return the bytes of one chunk, fetching it at demand priority if needed."""
+        for _ in range(3):
+            event = self._request(index, DEMAND, self.generation)
+            if event:
+                event.wait()
+            with self._lock:
+                if index in self._present:
+                    self._present.move_to_end(index)
+                    break
+        else:
+            raise IOError(f"Stream chunk {index} unavailable")
+        with open(self._path(index), "rb") as f:
+            return f.read()
+
+    def read(self, start, end):
+        """Yield bytes start..end (inclusive), driving read-ahead from the read position."""
+        first = start // self.chunk_size
+        if abs(first - self.playhead) > READ_AHEAD:
+            self.generation += 1  # A seek: drop queued read-ahead for the old position
+        position = start
+        while position <= end:
+            index = position // self.chunk_size
+            self.playhead = index
+            for ahead in range(index + 1, min(index + 1 + READ_AHEAD, self.count)):
+                self._request(ahead, READ_AHEAD_PRIORITY, self.generation)
+            data = self._chunk(index)
+            offset = position - index * self.chunk_size
+            piece = data[offset:offset + end - position + 1]
+            yield piece
+            position += len(piece)
@@ -1,139 +1,37 @@
-import vlc
+"""Tk frontend: a window onto the engine (engine.py), which it starts if needed.
+
+Closing the window leaves the engine, and playback, running, so reopening
+is instant; Exit stops both. Nothing here imports VLC or the network
+stack, so the window is up before the engine has finished warming up.
+"""
+import json
 import os
-from flask import Flask, jsonify
-import requests
-from threading import Thread
-import warnings
-import logging
-from waitress import serve
-import time
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import threading
-
-
-app = Flask(__name__)
-player = None
-partner_url = None
-file_loaded = False
-
-
-log = logging.getLogger('werkzeug')
-log.setLevel(logging.ERROR)
-app.logger.disabled = True
-
-warnings.filterwarnings("ignore")
-
-@app.route('/play')
-def remote_play():
-    if player:
-        player.play()
-        return jsonify({"status": "success", "action": "play"})
-    return jsonify({"status": "error", "message": "Player not initialized"})
-
-@app.route('/pause')
-def remote_pause():
-    if player:
-        player.pause()
-        return jsonify({"status": "success", "action": "pause"})
-    return jsonify({"status": "error", "message": "Player not initialized"})
-
-@app.route('/seek/<int:seconds>')
-def remote_seek(seconds):
-    if player:
-        player.set_time(seconds * 1000)  # Seek to the absolute time
-        return jsonify({"status": "success", "action": "seek", "time": seconds})
-    return jsonify({"status": "error", "message": "Player not initialized"})
-
-@app.route('/stop')
-def remote_stop():
-    if player:
-        player.stop()
-        return jsonify({"status": "success", "action": "stop"})
-    return jsonify({"status": "error", "message": "Player not initialized"})
-
-@app.route('/is_file_loaded')
-def is_file_loaded():
-    return jsonify({"status": "success", "file_loaded": file_loaded})
-
-@app.route('/load_file', methods=['POST'])
-def load_file():
-    global file_loaded
-    file_loaded = True
-    return jsonify({"status": "success", "action": "file loaded"})
-
-def start_server():
-    serve(app, host='0.0.0.0', port=5000)
-
-def send_command(command, params=None):
-    if not partner_url:
-        app_status.set("Partner URL not set.")
-        return False  # Indicate failure to send the command
-
-    def perform_request():
-        nonlocal command, params
-        app_status.set("Trying to connect with partner...")
-        retries = 3
-        for attempt in range(retries):
-            try:
-                if params:
-                    url = f"{partner_url}/{command}/{params}"
-                else:
-                    url = f"{partner_url}/{command}"
-                response = requests.get(url, timeout=5)  # Increased timeout
-                if response.status_code == 200:
-                    app_status.set("Connected successfully.")
-                    return True  # Command sent successfully
-            except requests.exceptions.RequestException as e:
-                print(f"Failed to send command to partner: {command}. Attempt {attempt + 1} of {retries}. Error: {e}")
-                app_status.set(f"Failed to connect. Retrying... ({attempt + 1}/{retries})")
-                if attempt < retries - 1:
-                    time.sleep(0.5)  # Wait before retrying
-        app_status.set("Failed to connect to partner.")
-        return False  # Command sending failed
-
-    # Run the request synchronously and return the result
-    return perform_request()
-
-
-def parse_time_to_seconds(hhmmss):
-    try:
-        parts = hhmmss.split(".")
-        hours = int(parts[0]) if len(parts) > 0 else 0
-        minutes = int(parts[1]) if len(parts) > 1 else 0
-        seconds = int(parts[2]) if len(parts) > 2 else 0
-        return hours * 3600 + minutes * 60 + seconds
-    except ValueError:
-        messagebox.showerror("Error", "Invalid time format. Please use HH.MM.SS format.")
-        return None
-
-def format_time(milliseconds):
-    seconds = milliseconds // 1000
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    seconds = seconds % 60
-    return f"{hours:02}:{minutes:02}:{seconds:02}"
+import startup
+from dispatcher import Dispatcher
+from ipc import EngineClient
+from timecodes import format_time, parse_time_to_ms
+
 
 class VideoPlayerApp:
-    def __init__(self, root):
+    def __init__(self, root, engine=None, report_startup=False):
         self.root = root
         self.root.title("Video Player")
         self.file_path = None
-
-        global player
-        instance = vlc.Instance("--quiet")
-        player = instance.media_player_new()
+        self.dispatcher = Dispatcher(root, max_workers=1)  # One worker, so requests reach the engine in order
 
         # Partner URL
-        tk.Label(root, text="Partner URL:").grid(row=0, column=0, sticky="w", padx=10, pady=5)
+        tk.Label(root, text="Partner URLs:").grid(row=0, column=0, sticky="w", padx=10, pady=5)
         self.partner_url_entry = tk.Entry(root, width=40)
         self.partner_url_entry.grid(row=0, column=1, padx=10, pady=5)
+        self.partner_url_entry.bind("<Return>", self.connect_partner)
+        self.partner_url_entry.bind("<FocusOut>", self.connect_partner)
 
         # Status Message
-        global app_status
-        app_status = tk.StringVar()
-        app_status.set("Idle")
-        tk.Label(root, textvariable=app_status, fg="blue").grid(row=1, column=0, columnspan=2, pady=5)
+        self.app_status = tk.StringVar()
+        self.app_status.set("Starting engine...")
+        tk.Label(root, textvariable=self.app_status, fg="blue").grid(row=1, column=0, columnspan=2, pady=5)
 
         # Select File
         tk.Button(root, text="Select Video File", command=self.select_file).grid(row=2, column=0, columnspan=2, pady=5)
@@ -157,7 +55,7 @@ class VideoPlayerApp:
         tk.Button(root, text="Seek", command=self.seek).grid(row=7, column=2, columnspan=1, pady=5)
 
         # Seek to Time
-        tk.Label(root, text="Seek to (HH.MM.SS):").grid(row=9, column=0, sticky="w", padx=10, pady=5)
+        tk.Label(root, text="Seek to (HH.MM.SS[.mmm]):").grid(row=9, column=0, sticky="w", padx=10, pady=5)
         self.seek_time_entry = tk.Entry(root, width=10)
         self.seek_time_entry.grid(row=9, column=1, padx=10, pady=5)
         tk.Button(root, text="Seek to Time", command=self.seek_to_time).grid(row=9, column=2, columnspan=1, pady=5)
@@ -168,21 +66,105 @@ class VideoPlayerApp:
         # Exit
         tk.Button(root, text="Exit", command=self.exit_app).grid(row=11, column=1, columnspan=2, pady=5)
 
-        # Update Progress
-        self.update_progress()
-
-    def update_progress(self):
-        """Update the progress bar and label."""
-        if player:
-            current_time = player.get_time()  # Current time in milliseconds
-            total_time = player.get_length()  # Total duration in milliseconds
-            if total_time > 0:
-                progress = (current_time / total_time) * 100
-                self.progress_bar["value"] = progress
-                self.progress_label.config(
-                    text=f"{format_time(current_time)} / {format_time(total_time)}"
-                )
-        self.root.after(500, self.update_progress)  # Update every 500ms
+        # Stats
+        tk.Button(root, text="Stats", command=self.show_stats).grid(row=11, column=2, pady=5)
+        self.stats_window = None
+
+        # Download from Partner
+        tk.Button(root, text="Download from Partner", command=self.download_from_partner).grid(row=12, column=0, padx=10, pady=5)
+        self.transfer_bar = ttk.Progressbar(root, orient="horizontal", length=300, mode="determinate")
+        self.transfer_bar.grid(row=12, column=1, padx=10, pady=5)
+        tk.Button(root, text="Stream from Partner", command=self.stream_from_partner).grid(row=13, column=0, padx=10, pady=5)
+
+        # Progress, status and notices are pushed by the engine
+        self.current_time = 0
+        self.total_time = 0
+        self.engine = engine or EngineClient()
+        self.engine.on_event = lambda event: self.dispatcher.call_soon(self.on_engine_event, event)
+        self.report_startup = report_startup  # Print startup timings once attached, then close
+
+    def attach(self):
+        """Connect to the engine, starting it if needed, without holding up the window."""
+        self.dispatcher.submit(self.engine.connect, on_done=self.attached, on_error=self.attach_failed)
+
+    def attach_failed(self, error):
+        self.app_status.set(f"Engine unavailable: {error}")
+        if self.report_startup:
+            print(json.dumps({"frontend": startup.report(), "error": str(error)}), flush=True)
+            self.close()
+
+    def attached(self, engine):
+        startup.mark("attached")
+        self.request("state", on_done=self.show_state)
+
+    def show_state(self, state):
+        """Show what the engine is already doing, e.g. after the window was reopened."""
+        if self.report_startup:
+            print(json.dumps({"frontend": startup.report(), "engine": state and state["startup"]}), flush=True)
+            self.close()
+            return
+        if not state:
+            return
+        self.app_status.set(state["text"])
+        if state["partners"] and not self.partner_url_entry.get().strip():
+            self.partner_url_entry.insert(0, state["partners"])
+        self.file_path = state["media"]
+        self.update_progress({"time": max(state["time"], 0), "length": state["length"]})
+
+    def request(self, action, params=None, on_done=None):
+        """Send a request to the engine off the Tk thread.
+
+        on_done(reply) then runs on the Tk thread, with None if the request
+        failed; the error has been shown by then.
+        """
+        self.dispatcher.submit(
+            self.engine.call, action, params,
+            on_done=lambda reply: self.replied(reply, on_done),
+            on_error=lambda error: self.request_failed(error, on_done),
+        )
+
+    def replied(self, reply, on_done):
+        if reply.get("status") == "error":
+            messagebox.showwarning("Warning", reply.get("message", "Request failed."))
+            reply = None
+        if on_done:
+            on_done(reply)
+
+    def request_failed(self, error, on_done):
+        self.app_status.set(str(error))
+        if on_done:
+            on_done(None)
+
+    def on_engine_event(self, event):
+        kind = event["kind"]
+        if kind == "status":
+            self.app_status.set(event["text"])
+        elif kind == "progress":
+            self.update_progress(event)
+        elif kind == "notice":
+            show = {"info": messagebox.showinfo, "error": messagebox.showerror}.get(event["level"], messagebox.showwarning)
+            show(event["level"].capitalize(), event["text"])
+        elif kind == "transfer":
+            self.show_transfer(event["done"], event["total"])
+        elif kind == "partners" and not self.partner_url_entry.get().strip():
+            self.partner_url_entry.insert(0, event["text"])
+        elif kind == "closed":
+            self.app_status.set("Engine stopped.")
+
+    def update_progress(self, batch):
+        """Update the progress bar and label from a batch of player events."""
+        if batch.get("stopped") or batch.get("end"):
+            self.current_time = 0
+        self.current_time = batch.get("time", self.current_time)  # Current time in milliseconds
+        self.total_time = batch.get("length", self.total_time)  # Total duration in milliseconds
+        if self.total_time > 0:
+            progress = (self.current_time / self.total_time) * 100
+            self.progress_bar["value"] = progress
+            self.progress_label.config(
+                text=f"{format_time(self.current_time)} / {format_time(self.total_time)}"
+            )
+        if batch.get("stopped"):
+            self.reset_progress()
 
     def select_file(self):
         self.file_path = filedialog.askopenfilename(filetypes=[("Video files", "*.mp4;*.avi;*.mkv")])
@@ -192,107 +174,132 @@ class VideoPlayerApp:
             messagebox.showerror("Error", "File does not exist. Please try again.")
             return
 
-        media = player.get_instance().media_new(self.file_path)
-        player.set_media(media)
+        self.load_media(self.file_path)
 
-        # Mark file as loaded locally
-        requests.post("http://127.0.0.1:5000/load_file")  # Update local Flask server status
-
-        # Notify partner device
+    def load_media(self, path):
+        self.file_path = path
         self.set_partner_url()
-        if not send_command("load_file"):
-            messagebox.showwarning("Warning", "Failed to notify partner about file load.")
-
-        # Check partner status
-        if not self.check_partner_file_status():
-            messagebox.showwarning("Warning", "Partner device has not loaded the file yet.")
-        else:
-            messagebox.showinfo("Info", f"File loaded: {self.file_path}")
-
-    def check_partner_file_status(self):
-        if not partner_url:
-            app_status.set("Partner URL not set.")
-            return False
-
-        try:
-            response = requests.get(f"{partner_url}/is_file_loaded", timeout=5)
-            if response.status_code == 200 and response.json().get("file_loaded"):
-                return True
-        except requests.exceptions.RequestException as e:
-            print(f"Error checking partner file status: {e}")
-        return False
-
+        self.request("load", path)
 
     def play(self):
         self.set_partner_url()
-        if not self.check_partner_file_status():
-            messagebox.showwarning("Warning", "File not loaded on both devices.")
-            return
-        if send_command("play"):  # Execute on partner first
-            player.play()  # Play on local only if successful on partner
-    
+        self.request("play")  # Play on local only if successful on partner
+
     def pause(self):
         self.set_partner_url()
-        if not self.check_partner_file_status():
-            messagebox.showwarning("Warning", "File not loaded on both devices.")
-            return
-        if send_command("pause"):  # Execute on partner first
-            player.pause()  # Pause on local only if successful on partner
-    
+        self.request("pause")  # Pause on local only if successful on partner
+
     def stop(self):
         self.set_partner_url()
-        if not self.check_partner_file_status():
-            messagebox.showwarning("Warning", "File not loaded on both devices.")
-            return
-        if send_command("stop"):  # Execute on partner first
-            player.stop()  # Stop on local only if successful on partner
-            self.progress_bar["value"] = 0  # Reset the progress bar
-            self.progress_label.config(text="00:00:00 / 00:00:00")  # Reset the label text
-    
-    
+        self.request("stop")  # Stop on local only if successful on partner
+
+    def reset_progress(self):
+        self.progress_bar["value"] = 0  # Reset the progress bar
+        self.progress_label.config(text="00:00:00 / 00:00:00")  # Reset the label text
+
     def seek(self):
         self.set_partner_url()
         try:
-            seconds = int(self.seek_entry.get())
-            if send_command("seek", seconds):  # Execute on partner first
-                player.set_time(seconds * 1000)  # Seek on local only if successful on partner
+            ms = int(round(float(self.seek_entry.get()) * 1000))  # Seconds, fractions allowed
         except ValueError:
             messagebox.showerror("Error", "Invalid input. Please enter a number.")
-    
+            return
+        self.request("seek", ms)  # Seek on local only if successful on partner
+
     def seek_to_time(self):
         self.set_partner_url()
-        time_input = self.seek_time_entry.get()
-        seconds = parse_time_to_seconds(time_input)
-        if seconds is not None and send_command("seek", seconds):  # Execute on partner first
-            player.set_time(seconds * 1000)  # Seek on local only if successful on partner
+        ms = parse_time_to_ms(self.seek_time_entry.get())
+        if ms is None:
+            messagebox.showerror("Error", "Invalid time format. Please use HH.MM.SS or HH.MM.SS.mmm format.")
+            return
+        self.request("seek", ms)  # Seek on local only if successful on partner
+
+    def download_from_partner(self):
+        """Copy the partner's loaded file here; rerun with the same target to resume."""
+        self.set_partner_url()
+        dest = filedialog.asksaveasfilename(filetypes=[("Video files", "*.mp4;*.avi;*.mkv")])
+        if dest:
+            self.request("download", dest)
+
+    def stream_from_partner(self):
+        """Start playing the partner's file while it is fetched into the local cache."""
+        self.set_partner_url()
+        self.request("stream")
+
+    def show_transfer(self, done, total):
+        self.transfer_bar["value"] = done * 100 / total if total else 0
+        self.app_status.set(f"Downloaded {done // (1024 * 1024)} / {total // (1024 * 1024)} MB")
 
     def show_info(self):
-        if player:
-            duration = player.get_length()
-            current_time = player.get_time()
-            if duration > 0 and current_time >= 0:
-                remaining_time = duration - current_time
-                messagebox.showinfo(
-                    "Media Info",
-                    f"Total Duration: {format_time(duration)}\n"
-                    f"Current Position: {format_time(current_time)}\n"
-                    f"Time Remaining: {format_time(remaining_time)}"
-                )
-            else:
-                messagebox.showwarning("Warning", "Unable to retrieve media information.")
+        self.request("state", on_done=self.show_media_info)
+
+    def show_media_info(self, state):
+        if state is None:
+            return
+        duration, current_time = state["length"], state["time"]
+        if duration > 0 and current_time >= 0:
+            remaining_time = duration - current_time
+            messagebox.showinfo(
+                "Media Info",
+                f"Total Duration: {format_time(duration)}\n"
+                f"Current Position: {format_time(current_time)}\n"
+                f"Time Remaining: {format_time(remaining_time)}"
+            )
         else:
-            messagebox.showerror("Error", "Player is not initialized.")
+            messagebox.showwarning("Warning", "Unable to retrieve media information.")
+
+    def show_stats(self):
+        """Open a panel with live latency, retry and sync figures."""
+        if self.stats_window and self.stats_window.winfo_exists():
+            self.stats_window.lift()
+            return
+        self.stats_window = tk.Toplevel(self.root)
+        self.stats_window.title("Stats")
+        label = tk.Label(self.stats_window, justify="left", font=("Courier", 9))
+        label.pack(padx=10, pady=10)
+        self.refresh_stats(label)
+
+    def refresh_stats(self, label):
+        if label.winfo_exists():
+            self.request("stats", on_done=lambda reply: self.show_stats_text(label, reply))
+
+    def show_stats_text(self, label, reply):
+        """Show the figures, then ask again in a second; one request is in flight at most."""
+        if not label.winfo_exists():
+            return  # The panel was closed
+        if reply:
+            label.config(text=reply["text"])
+        self.root.after(1000, self.refresh_stats, label)
 
     def set_partner_url(self):
-        global partner_url
-        partner_url = self.partner_url_entry.get().strip()
+        self.request("partners", self.partner_url_entry.get())
+
+    def connect_partner(self, event=None):
+        """Open the control channels as soon as the URLs are entered so sync can start."""
+        self.set_partner_url()
 
     def exit_app(self):
-        player.stop()
+        # Stop playback and the engine along with the window
+        self.request("shutdown", on_done=lambda reply: self.close())
+
+    def close(self):
+        """Close the window only; the engine keeps playing for the next frontend."""
+        self.engine.on_event = None
+        self.engine.close()
+        self.dispatcher.shutdown()
         self.root.quit()
 
-if __name__ == "__main__":
-    Thread(target=start_server, daemon=True).start()
+
+def main(engine=None, report_startup=False):
+    startup.mark("imports")
     root = tk.Tk()
-    app = VideoPlayerApp(root)
+    app = VideoPlayerApp(root, engine, report_startup)
+    root.protocol("WM_DELETE_WINDOW", app.close)
+    root.update()  # Map the window before anything else happens
+    startup.mark("window")
+    app.attach()
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
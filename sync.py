@@ -0,0 +1,120 @@
+import threading
+from collections import deque
+
+import metrics
+from clocksync import clock_now
+
+DEADBAND = 0.04  # Drift below this (seconds) is left alone
+SEEK_THRESHOLD = 1.0  # Drift above this is fixed with a hard seek
+MAX_NUDGE = 0.05  # Largest playback-rate deviation from 1.0
+HORIZON = 4.0  # Seconds over which a rate nudge should absorb the drift
+
+
+class DriftCorrector:
+    """Background loop that keeps the local player locked to the partner.
+
+    Every interval it asks the partner for a timestamped position,
+    extrapolates it to "now" with the clock offset, and compares it with the
+    local position. Small drift is absorbed by nudging the playback rate,
+    large drift by seeking. Only the follower corrects; the peer that issued
+    the last command leads, so the two sides never chase each other.
+    """
+
+    def __init__(self, player, clock=None, request=None, interval=1.0, history=120):
+        self.player = player
+        self.clock = clock
+        self.request = request
+        self.interval = interval
+        self.following = False
+        self.buffering = False
+        self.rate = 1.0
+        self.drift = None
+        self.drift_history = deque(maxlen=history)
+        self.rate_history = deque(maxlen=history)
+        self.corrections = {"nudge": 0, "seek": 0}
+        self._sync_error = metrics.histogram("streamer_sync_error_seconds", "Absolute position drift from the leader")
+        self._stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def follow(self, clock, request):
+        """Lock onto the peer with this clock estimate and request function."""
+        self.clock = clock
+        self.request = request
+        self.following = True
+
+    def lead(self):
+        self.following = False
+
+    def on_player_event(self, name, value):
+        """Player event listener: hold corrections while the decoder is buffering."""
+        if name == "buffering":
+            self.buffering = value < 100
+        elif name in ("playing", "stopped", "end"):
+            self.buffering = False
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                print(f"Drift correction failed: {e}")
+
+    def measure(self):
+        """Return local minus partner position in seconds, or None if unknown."""
+        if self.clock is None or not self.clock.synced:
+            return None
+        reply = self.request("position", None, timeout=self.interval)
+        if not reply or reply.get("pos") is None:
+            return None
+        if not reply.get("playing"):
+            return None
+        partner_pos = reply["pos"] / 1000
+        elapsed = clock_now() - self.clock.to_local(reply["ts"])
+        partner_pos += elapsed * reply.get("rate", 1.0)
+        return self.player.get_time() / 1000 - partner_pos
+
+    def step(self):
+        if not self.following or not self.player.is_playing():
+            self._set_rate(1.0)
+            return
+        if self.buffering:
+            return  # Position is frozen while buffering; measuring now would overcorrect
+        drift = self.measure()
+        if drift is None:
+            return
+        self.drift = drift
+        self.drift_history.append((clock_now(), drift))
+        self._sync_error.observe(abs(drift))
+        if abs(drift) >= SEEK_THRESHOLD:
+            self.player.set_time(int(self.player.get_time() - drift * 1000))
+            self.corrections["seek"] += 1
+            self._set_rate(1.0)
+        elif abs(drift) >= DEADBAND:
+            nudge = max(-MAX_NUDGE, min(MAX_NUDGE, drift / HORIZON))
+            self.corrections["nudge"] += 1
+            self._set_rate(1.0 - nudge)  # Ahead of the partner: slow down
+        else:
+            self._set_rate(1.0)
+
+    def _set_rate(self, rate):
+        if rate == self.rate:
+            return
+        self.player.set_rate(rate)
+        self.rate = rate
+        self.rate_history.append((clock_now(), rate))
+
+    def stats(self):
+        return {
+            "following": self.following,
+            "drift": self.drift,
+            "rate": self.rate,
+            "corrections": dict(self.corrections),
+            "drift_history": list(self.drift_history),
+            "rate_history": list(self.rate_history),
+        }
@@ -0,0 +1,47 @@
+"""Framed control connections surviving handlers that raise."""
+import socket
+import threading
+
+from control import Connection, ControlChannel
+
+
+def failing(action, params=None, **fields):
+    if action == "seek":
+        return {"status": "success", "action": action, "pos": int(params)}  # TypeError for params=None
+    return {"status": "success", "action": action}
+
+
+def test_handler_error_is_acked_and_the_reader_goes_on():
+    left, right = socket.socketpair()
+    server = Connection(right, failing)
+    threading.Thread(target=server.serve, daemon=True).start()
+    client = Connection(left)
+    threading.Thread(target=client.serve, daemon=True).start()
+    reply = client.request("seek", None, timeout=2)
+    assert reply["status"] == "error" and "int()" in reply["message"]
+    assert client.request("play", timeout=2)["status"] == "success"
+
+
+def test_channel_reconnects_after_a_reader_failure():
+    listener = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+
+    def accept():
+        while True:
+            sock, _ = listener.accept()
+            conn = Connection(sock, failing)
+            accepted.append(conn)
+            threading.Thread(target=conn.serve, daemon=True).start()
+            conn.push_state({"bad": True})
+
+    threading.Thread(target=accept, daemon=True).start()
+    seen = threading.Semaphore(0)
+
+    def on_state(state):
+        seen.release()
+        raise RuntimeError("state handler broke")
+
+    channel = ControlChannel("127.0.0.1", listener.getsockname()[1], on_state=on_state).start()
+    assert seen.acquire(timeout=5) and seen.acquire(timeout=5), "the channel did not reconnect"
+    assert channel.wait_connected(5)
+    channel.close()
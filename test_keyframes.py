@@ -0,0 +1,155 @@
+"""build_index on hand-built MP4 and MKV files, well-formed and malformed."""
+import struct
+import threading
+
+from keyframes import KeyframeStore, build_index
+
+
+def box(kind, *children):
+    payload = b"".join(children)
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def table(kind, values, entries=None, fmt="I"):
+    """A full box holding a table of big-endian integers, as the sample tables are laid out."""
+    count = len(values) if entries is None else entries
+    return box(kind, struct.pack(">II", 0, count), struct.pack(f">{len(values)}{fmt}", *values))
+
+
+def mp4(stts, stss=None, ctts=None, stsc=(1, 5, 1), stsz=(10, 10), stco=(100, 600), timescale=1000):
+    """An MP4 with one video track; stsz is (uniform size, sample count) or a list of sizes."""
+    tables = [table(b"stts", stts)]
+    if stss is not None:
+        tables.append(table(b"stss", stss))
+    if ctts is not None:
+        tables.append(table(b"ctts", ctts, fmt="i"))
+    tables.append(table(b"stsc", stsc, len(stsc) // 3))
+    if isinstance(stsz, tuple):
+        tables.append(box(b"stsz", struct.pack(">III", 0, *stsz)))
+    else:
+        tables.append(box(b"stsz", struct.pack(f">III{len(stsz)}I", 0, 0, len(stsz), *stsz)))
+    tables.append(table(b"stco", stco))
+    mdhd = box(b"mdhd", struct.pack(">IIIII", 0, 0, 0, timescale, 0))
+    hdlr = box(b"hdlr", struct.pack(">II4s", 0, 0, b"vide"))
+    trak = box(b"trak", box(b"mdia", mdhd, hdlr, box(b"minf", box(b"stbl", *tables))))
+    return box(b"ftyp", b"isom\0\0\0\0") + box(b"moov", trak)
+
+
+def element(element_id, *children):
+    payload = b"".join(children)
+    size = (0x01 << 56 | len(payload)).to_bytes(8, "big")  # Eight-byte size vint
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + size + payload
+
+
+def uint(element_id, value):
+    return element(element_id, value.to_bytes(4, "big"))
+
+
+def mkv(cues, scale=1_000_000, video_track=2):
+    """An MKV whose Cues hold (time, track, cluster position) points."""
+    info = element(0x1549A966, uint(0x2AD7B1, scale))
+    tracks = element(0x1654AE6B, element(0xAE, uint(0xD7, 1), uint(0x83, 2)),
+                     element(0xAE, uint(0xD7, video_track), uint(0x83, 1)))
+    points = [element(0xBB, uint(0xB3, time), element(0xB7, uint(0xF7, track), uint(0xF1, cluster)))
+              for time, track, cluster in cues]
+    segment = element(0x18538067, info, tracks, element(0x1C53BB6B, *points))
+    return element(0x1A45DFA3, uint(0x4286, 1)) + segment
+
+
+def index(tmp_path, data, timeout=5.0):
+    """build_index on `data`, failing instead of hanging if the parser never returns."""
+    path = tmp_path / "media"
+    path.write_bytes(data)
+    result = {}
+    worker = threading.Thread(target=lambda: result.setdefault("index", build_index(str(path))), daemon=True)
+    worker.start()
+    worker.join(timeout)
+    assert not worker.is_alive(), "build_index did not return"
+    return result["index"]
+
+
+def test_mp4_sync_samples(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[1, 5, 9]))
+    assert list(found.times) == [0, 4000, 8000]
+    assert list(found.offsets) == [100, 140, 630]
+
+
+def test_mp4_every_sample_is_sync_without_stss(tmp_path):
+    found = index(tmp_path, mp4(stts=[4, 500, 6, 1000]))
+    assert list(found.times) == [0, 500, 1000, 1500, 2000, 3000, 4000, 5000, 6000, 7000]
+
+
+def test_mp4_composition_offsets(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[1, 6], ctts=[1, 2000, 4, 0, 1, 1000, 4, 0]))
+    assert list(found.times) == [2000, 6000]
+
+
+def test_mp4_variable_sample_sizes(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[3, 7], stsz=[10, 20, 30, 40, 50, 60, 70, 80, 90, 100]))
+    assert list(found.offsets) == [130, 660]
+
+
+def test_mp4_sync_samples_past_stts_are_dropped(tmp_path):
+    found = index(tmp_path, mp4(stts=[3, 1000], stss=[1, 2, 50]))
+    assert list(found.times) == [0, 1000]
+
+
+def test_mp4_unsorted_and_zero_sync_samples(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[9, 0, 1, 5, 5]))
+    assert list(found.times) == [0, 4000, 8000]
+
+
+def test_mp4_empty_runs(tmp_path):
+    found = index(tmp_path, mp4(stts=[0, 1000, 10, 1000, 0, 5], stss=[2, 10], ctts=[0, 7, 10, 0]))
+    assert list(found.times) == [1000, 9000]
+
+
+def test_mp4_ctts_shorter_than_stts(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[1, 9], ctts=[2, 500]))
+    assert list(found.times) == [500, 8500]
+
+
+def test_mp4_bad_chunk_tables_leave_offsets_unknown(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[1, 9], stsc=(0, 5, 1, 9, 5, 1), stco=(100,)))
+    assert list(found.times) == [0, 8000]
+    assert list(found.offsets) == [100, -1]
+
+
+def test_mp4_short_stsz(tmp_path):
+    found = index(tmp_path, mp4(stts=[10, 1000], stss=[1, 9], stsz=[10, 20, 30]))
+    assert list(found.offsets) == [100, -1]
+
+
+def test_mp4_odd_stts(tmp_path):
+    found = index(tmp_path, mp4(stts=[3, 1000, 7], stss=[1, 3]))
+    assert list(found.times) == [0, 2000]
+
+
+def test_mp4_truncated_file_gives_up(tmp_path):
+    data = mp4(stts=[10, 1000], stss=[1, 5, 9])
+    for cut in range(8, len(data), 7):
+        store = KeyframeStore(str(tmp_path / "cache"))
+        path = tmp_path / f"cut{cut}"
+        path.write_bytes(data[:cut])
+        future = store._pool.submit(store._load_or_build, str(path), f"cut{cut}")
+        future.result(timeout=5.0)  # An index, None, or a logged failure; never a hang or an exception
+
+
+def test_mkv_cues(tmp_path):
+    found = index(tmp_path, mkv([(0, 2, 1000), (0, 1, 900), (4000, 2, 5000)]))
+    assert list(found.times) == [0, 4000]
+    assert len(found.offsets) == 2 and found.offsets[1] - found.offsets[0] == 4000
+
+
+def test_mkv_timecode_scale(tmp_path):
+    found = index(tmp_path, mkv([(0, 2, 0), (200, 2, 10)], scale=10_000_000))
+    assert list(found.times) == [0, 2000]
+
+
+def test_mkv_truncated_cues(tmp_path):
+    data = mkv([(0, 2, 1000), (4000, 2, 5000)])
+    assert index(tmp_path, data[:-50]).times.tolist() == [0]
+
+
+def test_other_formats_have_no_index(tmp_path):
+    assert index(tmp_path, b"RIFF\0\0\0\0AVI LIST" + bytes(64)) is None
@@ -0,0 +1,112 @@
+"""The relay hub (port.py) answering room queries from its members' replies."""
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+
+from bench_sync import setup_node
+from control import ControlChannel
+from fakeplayer import SimulatedPlayer
+import metrics
+from playeractor import PlayerActor
+from port import RelayHub
+from preroll import Preroller
+
+
+def start_hub():
+    hub = RelayHub(host="127.0.0.1", port=0)
+    ready = Future()
+    threading.Thread(target=lambda: asyncio.run(hub.serve(ready)), daemon=True).start()
+    return hub, ready.result(5)
+
+
+def join(port, room, handler=None):
+    """A member of `room` whose commands go to handler(action, params, **fields)."""
+    joined = threading.Event()
+    channel = ControlChannel("127.0.0.1", port, handler)
+    channel.on_connect = lambda: channel.request("join", room, timeout=5) and joined.set()
+    channel.start()
+    assert joined.wait(5), "could not join the room"
+    return channel
+
+
+def answering(**reply):
+    return lambda action, params=None, **fields: dict(reply, status=reply.get("status", "success"))
+
+
+def test_empty_room_is_not_loaded():
+    _, port = start_hub()
+    sender = join(port, "empty")
+    reply = sender.request("is_file_loaded", timeout=2)
+    assert reply["status"] == "error" and "file_loaded" not in reply
+
+
+def test_loaded_member():
+    _, port = start_hub()
+    sender = join(port, "one")
+    join(port, "one", answering(file_loaded=True, node="b", fingerprint="fp"))
+    reply = sender.request("is_file_loaded", timeout=2)
+    assert reply["status"] == "success"
+    assert (reply["file_loaded"], reply["node"], reply["fingerprint"]) == (True, "b", "fp")
+
+
+def test_room_is_loaded_only_if_every_member_is():
+    _, port = start_hub()
+    sender = join(port, "two")
+    join(port, "two", answering(file_loaded=True, node="b", fingerprint="fp"))
+    join(port, "two", answering(file_loaded=False, node="c"))
+    reply = sender.request("is_file_loaded", timeout=2)
+    assert reply["file_loaded"] is False and "node" not in reply
+
+
+def test_members_with_different_files_match_nobody():
+    _, port = start_hub()
+    sender = join(port, "mixed")
+    join(port, "mixed", answering(file_loaded=True, fingerprint="fp1", match=True))
+    join(port, "mixed", answering(file_loaded=True, fingerprint="fp2", match=False))
+    reply = sender.request("load_file", timeout=2, fingerprint="fp1")
+    assert reply["match"] is False and reply["fingerprint"] not in ("fp1", "fp2")
+
+
+def test_silent_member_fails_the_query():
+    _, port = start_hub()
+    sender = join(port, "silent")
+    join(port, "silent", lambda action, params=None, **fields: time.sleep(2) or {"status": "success"})
+    reply = sender.request("is_file_loaded", timeout=2)
+    assert reply["status"] == "error"
+
+
+def prerolling(start_delay):
+    """A member handler that warms a simulated player up on prepare, as the engine does."""
+    simulated = SimulatedPlayer(start_delay=start_delay)
+    player = PlayerActor(simulated)
+    simulated.add_listener(player.on_player_event)
+    preroll = Preroller(player)
+    simulated.add_listener(preroll.on_player_event)
+
+    def handle(action, params=None, **fields):
+        if action == "prepare":
+            preroll.begin(int(params))
+            return {"status": "success", "action": action, "target": int(params)}
+        if action == "ready":
+            return dict(preroll.status(), status="success")
+        return {"status": "success", "action": action}
+
+    return handle
+
+
+def test_ready_barrier_through_a_hub():
+    hub, port = start_hub()
+    engine = setup_node(0, [f"tcp://127.0.0.1:{port}/barrier"])
+    engine.get_peer_set()  # Connects and joins the room
+    join(port, "barrier", prerolling(0.2))
+    join(port, "barrier", prerolling(0.5))
+    deadline = time.monotonic() + 5
+    while "barrier" not in hub.rooms or len(hub.rooms["barrier"].members) < 3:
+        assert time.monotonic() < deadline, "the engine did not join the room"
+        time.sleep(0.05)
+    stragglers = metrics.counter("streamer_preroll_stragglers_total").value
+    start = time.monotonic()
+    assert engine.ready_barrier(60000)
+    assert time.monotonic() - start < engine.PREROLL_DEADLINE / 2
+    assert metrics.counter("streamer_preroll_stragglers_total").value == stragglers
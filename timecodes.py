@@ -0,0 +1,19 @@
+def parse_time_to_ms(hhmmss):
+    """Parse HH.MM.SS, optionally followed by .mmm milliseconds; None if malformed."""
+    try:
+        parts = hhmmss.split(".")
+        hours = int(parts[0]) if len(parts) > 0 else 0
+        minutes = int(parts[1]) if len(parts) > 1 else 0
+        seconds = int(parts[2]) if len(parts) > 2 else 0
+        millis = int(parts[3].ljust(3, "0")[:3]) if len(parts) > 3 else 0
+        return (hours * 3600 + minutes * 60 + seconds) * 1000 + millis
+    except ValueError:
+        return None
+
+
+def format_time(milliseconds):
+    seconds = milliseconds // 1000
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    seconds = seconds % 60
+    return f"{hours:02}:{minutes:02}:{seconds:02}"
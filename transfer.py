@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from fingerprint import CACHE_DIR
+
+CHUNK_SIZE = 4 * 1024 * 1024
+MANIFEST_DIR = os.path.join(CACHE_DIR, "manifests")
+
+
+def chunk_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def build_manifest(path, fingerprint, chunk_size=CHUNK_SIZE):
+    """Describe a file as fixed-size chunks with a checksum for each."""
+    hashes = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            hashes.append(chunk_hash(block))
+    return {
+        "name": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "fingerprint": fingerprint,
+        "chunk_size": chunk_size,
+        "hashes": hashes,
+    }
+
+
+def fetch_manifest(base_url, timeout=120, cancelled=None):
+    """Wait for the partner at `base_url` to finish hashing and return its manifest."""
+    import requests
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not (cancelled and cancelled.is_set()):
+        response = requests.get(f"{base_url}/media/manifest", timeout=10)
+        if response.status_code == 200:
+            return response.json()
+        if response.status_code != 503:
+            raise RuntimeError(f"Partner has no media to share ({response.status_code})")
+        time.sleep(1)  # Partner is still hashing
+    raise TimeoutError("Partner did not finish preparing the transfer")
+
+
+class ManifestStore:
+    """Build transfer manifests in the background and cache them by fingerprint.
+
+    Hashing every chunk reads the whole file, so it only happens the first
+    time a partner asks for a given file.
+    """
+
+    def __init__(self, directory=MANIFEST_DIR):
+        self.directory = directory
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="manifest")
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, fingerprint):
+        """Return the manifest if ready, else start building it and return None."""
+        with self._lock:
+            future = self._futures.get(fingerprint)
+            if future is None:
+                future = self._pool.submit(self._load_or_build, path, fingerprint)
+                self._futures[fingerprint] = future
+        if not future.done():
+            return None
+        return future.result()
+
+    def _load_or_build(self, path, fingerprint):
+        cache_path = os.path.join(self.directory, f"{fingerprint}.json")
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+        manifest = build_manifest(path, fingerprint)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(cache_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+        except OSError as e:
+            print(f"Failed to cache transfer manifest: {e}")
+        return manifest
+
+
+class Downloader:
+    """Fetch a partner's media in parallel Range segments, resumable across runs.
+
+    Chunks land in `<dest>.part` and each one is checked against the
+    manifest checksum before it is recorded in the `<dest>.part.json`
+    sidecar. A rerun after a disconnect only fetches the chunks that are
+    still missing.
+    """
+
+    def __init__(self, base_url, dest, workers=4, progress=None, retries=3):
+        self.base_url = base_url.rstrip("/")
+        self.dest = dest
+        self.part = f"{dest}.part"
+        self.sidecar = f"{dest}.part.json"
+        self.workers = workers
+        self.progress = progress  # progress(done_bytes, total_bytes), from worker threads
+        self.retries = retries
+        self.cancelled = threading.Event()
+        self.manifest = None
+        self._done = set()
+        self._lock = threading.Lock()
+
+    def fetch_manifest(self, timeout=120):
+        return fetch_manifest(self.base_url, timeout, self.cancelled)
+
+    def run(self):
+        """Download the file; returns the final path."""
+        self.manifest = self.fetch_manifest()
+        self._load_sidecar()
+        if not os.path.exists(self.part):
+            with open(self.part, "wb") as f:
+                f.truncate(self.manifest["size"])
+        missing = [i for i in range(len(self.manifest["hashes"])) if i not in self._done]
+        self._report()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as pool:
+            futures = [pool.submit(self._fetch_chunk, index) for index in missing]
+            for future in as_completed(futures):
+                future.result()
+        if self.cancelled.is_set():
+            raise RuntimeError("Download cancelled")
+        os.replace(self.part, self.dest)
+        os.remove(self.sidecar)
+        return self.dest
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def _load_sidecar(self):
+        try:
+            with open(self.sidecar, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        # Only resume a partial download of the very same file
+        if state.get("fingerprint") == self.manifest["fingerprint"] and os.path.exists(self.part):
+            self._done = set(state.get("done", []))
+
+    def _save_sidecar(self):
+        tmp = f"{self.sidecar}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.manifest["fingerprint"], "done": sorted(self._done)}, f)
+        os.replace(tmp, self.sidecar)
+
+    def _fetch_chunk(self, index):
+        import requests
+
+        chunk_size = self.manifest["chunk_size"]
+        start = index * chunk_size
+        end = min(start + chunk_size, self.manifest["size"]) - 1
+        session = requests.Session()
+        for attempt in range(self.retries):
+            if self.cancelled.is_set():
+                return
+            try:
+                response = session.get(
+                    f"{self.base_url}/media", headers={"Range": f"bytes={start}-{end}"}, timeout=30
+                )
+                data = response.content
+                if response.status_code == 206 and chunk_hash(data) == self.manifest["hashes"][index]:
+                    break
+                print(f"Chunk {index} failed verification. Attempt {attempt + 1} of {self.retries}.")
+            except requests.exceptions.RequestException as e:
+                print(f"Failed to fetch chunk {index}. Attempt {attempt + 1} of {self.retries}. Error: {e}")
+            time.sleep(0.5 * (attempt + 1))
+        else:
+            raise RuntimeError(f"Could not fetch chunk {index} from partner")
+        with open(self.part, "r+b") as f:
+            f.seek(start)
+            f.write(data)
+        with self._lock:
+            self._done.add(index)
+            self._save_sidecar()
+        self._report()
+
+    def _report(self):
+        if self.progress:
+            chunk_size = self.manifest["chunk_size"]
+            done = min(len(self._done) * chunk_size, self.manifest["size"])
+            self.progress(done, self.manifest["size"])
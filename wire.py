@@ -0,0 +1,212 @@
+"""Compact binary encoding of control messages, several to a frame.
+
+A binary payload starts with MAGIC, the format version and a message
+count:
+
+    magic B | version B | count B | message * count
+
+Commands, acks and state pushes have fixed headers, and their other
+fields follow as tagged values in the fixed struct format of the field:
+
+    cmd    kind B | id I | action B | nfields B | field * nfields
+    ack    kind B | id I | status B | nfields B | field * nfields
+    state  kind B | nfields B | field * nfields | nstate B | field * nstate
+    json   kind B | length I | UTF-8 JSON
+
+A field is its index in FIELDS, then the value; with the NONE bit set in
+the index the value is None and nothing follows. A message with an
+action, status or field outside the tables, or a value of another type,
+goes as a json record instead, so encoding never loses anything. JSON
+payloads start with "{" and never with MAGIC, so `decode` reads both.
+
+The tables only grow: what a code means never changes within a version.
+"""
+import json
+import struct
+
+MAGIC = 0xB5
+WIRE_VERSION = 1
+MAX_BATCH = 255  # Messages in one binary payload
+NONE = 0x80
+
+CMD, ACK, STATE, JSON = 1, 2, 3, 0x7F
+
+ACTIONS = (
+    "play", "pause", "seek", "stop", "clock", "position", "prepare", "ready",
+    "load_file", "is_file_loaded", "catch_up", "join",
+)
+STATUSES = ("success", "error", "pending")
+FIELDS = (
+    # Command fields ("v" is an int, float or string, for params)
+    ("params", "v"), ("at", "d"), ("seq", "I"), ("origin", "s"), ("require_loaded", "?"),
+    ("fingerprint", "s"), ("playing", "?"), ("src", "s"), ("sent", "d"),
+    # Ack and state fields: clock probes, position heartbeats, load state
+    ("node", "s"), ("file_loaded", "?"), ("action", "s"), ("time", "q"), ("target", "q"),
+    ("recv", "d"), ("send", "d"), ("pos", "q"), ("ts", "d"), ("rate", "d"),
+    ("match", "?"), ("stale", "?"), ("reason", "s"), ("message", "s"),
+    ("relayed", "I"), ("members", "I"), ("room", "s"),
+)
+
+_head = struct.Struct("!BBB")
+_command = struct.Struct("!BIB")  # Also the ack header, with the status in place of the action
+_record = struct.Struct("!BI")
+_byte = struct.Struct("!B")
+_string = struct.Struct("!BB")
+_long_string = struct.Struct("!BBH")
+_scalars = {code: struct.Struct("!B" + code) for code in "?qId"}
+_types = {"?": bool, "q": int, "I": int, "d": float}
+_variants = {int: (0, _scalars["q"]), float: (1, _scalars["d"])}
+
+_ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+_TAGS = {name: (tag, code) for tag, (name, code) in enumerate(FIELDS)}
+_COMMAND_ENVELOPE = ("type", "id", "action")
+_ACK_ENVELOPE = ("type", "id", "status")
+_STATE_ENVELOPE = ("type", "state")
+
+
+class _Unencodable(Exception):
+    """Raised for a message the tables cannot express."""
+
+
+def _pack_fields(message, skip, parts):
+    """Append the count and tagged fields of `message`, minus the keys in `skip`."""
+    index = len(parts)
+    parts.append(b"")
+    count = 0
+    for name, value in message.items():
+        if name in skip:
+            continue
+        tag, code = _TAGS[name]
+        if value is None:
+            parts.append(_byte.pack(tag | NONE))
+        elif code == "s":
+            data = value.encode("utf-8")
+            parts.append(_string.pack(tag, len(data)) + data)
+        elif code == "v":
+            if value.__class__ is str:
+                data = value.encode("utf-8")
+                parts.append(_long_string.pack(tag, 2, len(data)) + data)
+            else:
+                kind, scalar = _variants[value.__class__]
+                parts.append(_byte.pack(tag) + scalar.pack(kind, value))
+        elif value.__class__ is _types[code]:
+            parts.append(_scalars[code].pack(tag, value))
+        else:
+            raise _Unencodable(name)
+        count += 1
+    parts[index] = _byte.pack(count)
+
+
+def _encode_message(message):
+    parts = []
+    try:
+        kind = message["type"]
+        if kind == "cmd":
+            parts.append(_command.pack(CMD, message["id"], _ACTION_CODES[message["action"]]))
+            _pack_fields(message, _COMMAND_ENVELOPE, parts)
+        elif kind == "ack":
+            parts.append(_command.pack(ACK, message["id"], _STATUS_CODES[message["status"]]))
+            _pack_fields(message, _ACK_ENVELOPE, parts)
+        elif kind == "state" and message["state"].__class__ is dict:
+            parts.append(_byte.pack(STATE))
+            _pack_fields(message, _STATE_ENVELOPE, parts)
+            _pack_fields(message["state"], (), parts)
+        else:
+            raise _Unencodable(kind)
+        return b"".join(parts)
+    except (_Unencodable, KeyError, TypeError, AttributeError, struct.error):
+        data = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        return _record.pack(JSON, len(data)) + data
+
+
+def encode(messages):
+    """Encode up to MAX_BATCH messages as one binary payload."""
+    if len(messages) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} messages fit in one payload")
+    return _head.pack(MAGIC, WIRE_VERSION, len(messages)) + b"".join(map(_encode_message, messages))
+
+
+def _read_fields(payload, offset, into):
+    count = payload[offset]
+    offset += 1
+    for _ in range(count):
+        tag = payload[offset]
+        name, code = FIELDS[tag & ~NONE]
+        if tag & NONE:
+            into[name] = None
+            offset += 1
+        elif code == "s":
+            start = offset + 2
+            end = start + payload[offset + 1]
+            into[name] = str(payload[start:end], "utf-8")
+            offset = end
+        elif code == "v":
+            kind = payload[offset + 1]
+            if kind == 2:
+                (size,) = struct.unpack_from("!H", payload, offset + 2)
+                start = offset + 4
+                into[name] = str(payload[start:start + size], "utf-8")
+                offset = start + size
+            else:
+                scalar = _scalars["q" if kind == 0 else "d"]
+                into[name] = scalar.unpack_from(payload, offset + 1)[1]
+                offset += 1 + scalar.size
+        else:
+            scalar = _scalars[code]
+            into[name] = scalar.unpack_from(payload, offset)[1]
+            offset += scalar.size
+    return offset
+
+
+def _decode_message(payload, offset):
+    kind = payload[offset]
+    if kind == CMD:
+        _, msg_id, action = _command.unpack_from(payload, offset)
+        message = {"type": "cmd", "id": msg_id, "action": ACTIONS[action]}
+        return message, _read_fields(payload, offset + _command.size, message)
+    if kind == ACK:
+        _, msg_id, status = _command.unpack_from(payload, offset)
+        message = {"type": "ack", "id": msg_id, "status": STATUSES[status]}
+        return message, _read_fields(payload, offset + _command.size, message)
+    if kind == STATE:
+        message = {"type": "state"}
+        state = message["state"] = {}
+        offset = _read_fields(payload, offset + 1, message)
+        return message, _read_fields(payload, offset, state)
+    if kind == JSON:
+        _, size = _record.unpack_from(payload, offset)
+        start = offset + _record.size
+        return json.loads(payload[start:start + size]), start + size
+    raise ValueError(f"Unknown message kind {kind}")
+
+
+def is_binary(payload):
+    return bool(payload) and payload[0] == MAGIC
+
+
+def decode(payload):
+    """The messages in a frame payload or datagram, binary or JSON, as a non-empty list of dicts.
+
+    Raises ValueError if the payload is malformed, holds no messages, or
+    holds something other than JSON objects.
+    """
+    if not is_binary(payload):
+        messages = [json.loads(payload)]
+    else:
+        try:
+            _, version, count = _head.unpack_from(payload)
+            if version > WIRE_VERSION:
+                raise ValueError(f"Unsupported wire version {version}")
+            offset = _head.size
+            messages = []
+            for _ in range(count):
+                message, offset = _decode_message(payload, offset)
+                messages.append(message)
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            raise ValueError(f"Malformed binary payload: {e}") from None
+        if not messages:
+            raise ValueError("Empty binary payload")
+    if not all(message.__class__ is dict for message in messages):
+        raise ValueError("Messages must be JSON objects")
+    return messages